@@ -1,6 +1,23 @@
 # Imports
 from string_with_arrows import *
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from fractions import Fraction
+from threading import Lock, local
+from time import perf_counter
+import codecs
+import copy
+import gc
+import hashlib
+import marshal
+import math
+import mmap
+import os
 import string
+import re
+import sys
 
 
 
@@ -18,10 +35,10 @@ class Error:
         self.error_name = error_name
         self.details = details
 
-    def message(self):  # Returns the error message containing details about the file name and the error location
+    def message(self, width=None):  # Returns the error message containing details about the file name and the error location, width cuts long source lines down
         message = f"{self.error_name}: {self.details}\n"
         message += f"File {self.pos_start.file_name}, line {self.pos_start.line_num + 1}"
-        message += "\n\n" + string_with_arrows(self.pos_start.file_text, self.pos_start, self.pos_end)  # Allows for arrow indicators in the error message for better readability
+        message += "\n\n" + self.pos_start.source.arrows(self.pos_start, self.pos_end, width)  # Allows for arrow indicators in the error message for better readability
         return message
 
 # Subclasses of the Error parent class for different error types
@@ -39,10 +56,10 @@ class RunTimeError(Error):  # This is for errors picked up by the interpreter up
         super().__init__(pos_start, pos_end, "Runtime error", details)
         self.context = context
 
-    def message(self):
+    def message(self, width=None):
         message = self.generate_traceback()
         message += f"{self.error_name}: {self.details}\n"
-        message += "\n\n" + string_with_arrows(self.pos_start.file_text, self.pos_start, self.pos_end)  # Allows for arrow indicators in the error message for better readability
+        message += "\n\n" + self.pos_start.source.arrows(self.pos_start, self.pos_end, width)  # Allows for arrow indicators in the error message for better readability
         return message
         
     def generate_traceback(self):
@@ -58,27 +75,119 @@ class RunTimeError(Error):  # This is for errors picked up by the interpreter up
         return "Traceback (most recent call last):\n" + message
 
 
+class LimitError(RunTimeError):  # A run which went over one of its resource limits (see Limits), reported with a traceback like any runtime error
+    def __init__(self, pos_start, pos_end, details, context):
+        super().__init__(pos_start, pos_end, details, context)
+        self.error_name = "Limit exceeded"
+
+
+# Source class
+class Source:  # Holds the file name and text shared by every position in that file
+    def __init__(self, file_name, text):
+        self.file_name = file_name
+        self.text = text
+        self.line_starts = None  # Index of the first character of each line, only built once a line or column number is needed
+
+    def line_and_column(self, index):  # Works out the line and column numbers of an index by bisecting the line start index
+        if self.line_starts is None:
+            self.line_starts = line_start_index(self.text)
+        line_num = bisect_right(self.line_starts, index) - 1 if index >= 0 else 0
+        return line_num, index - self.line_starts[line_num]
+
+    def arrows(self, pos_start, pos_end, width=None):  # The lines of source between the positions with arrows under the span
+        self.line_and_column(pos_start.index)  # Builds the line start index the first time
+        return string_with_arrows(self.text, pos_start, pos_end, self.line_starts, width)
+
+
+# Stream source class
+class StreamSource:
+    """
+    The source of a program which is read as a stream, e.g. from a pipe. Only the most recent window_size characters are kept (in the
+    chunks they were read in) so memory stays flat however long the input is. Positions in a stream are StreamPositions, which know their
+    line and column, and an error whose text has already been dropped is reported without the arrows.
+    """
+    def __init__(self, file_name, window_size=1 << 20):
+        self.file_name = file_name
+        self.window_size = window_size
+        self.chunks = deque()
+        self.length = 0  # Number of characters in the chunks
+        self.base = 0  # Index of the first character kept
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        while self.length - len(self.chunks[0]) >= self.window_size:  # The oldest chunk isn't needed to keep a full window
+            dropped = self.chunks.popleft()
+            self.length -= len(dropped)
+            self.base += len(dropped)
+
+    @property
+    def text(self):  # The text which is still kept, starting at index base
+        return "".join(self.chunks)
+
+    def arrows(self, pos_start, pos_end, width=None):
+        if pos_start.index < self.base:
+            return "(the source of this part of the stream is no longer in memory)"
+        window = Source(self.file_name, self.text)  # Line and column numbers relative to the start of the window, which is all the arrows need
+        return window.arrows(Position(pos_start.index - self.base, window), Position(pos_end.index - self.base, window), width)
+
+
 # Position Class
-class Position:  # This will keep track of the line number, column number, current index, file name and file text.
-    def __init__(self, index, line_num, col_num, file_name, file_text):
+class Position:  # This will keep track of the current index in a shared source, the line and column numbers are only worked out when needed
+    __slots__ = ('index', 'source')  # Slots keep the many small objects of the lexer, parser and interpreter compact
+
+    def __init__(self, index, source):
         self.index = index
-        self.line_num = line_num
-        self.col_num = col_num
-        self.file_name = file_name
-        self.file_text = file_text
+        self.source = source
 
-    def advance(self, current_char = None):  # Advances into the next index and updates the line and column numbers if necessary
-        self.index += 1
-        self.col_num += 1
-        
-        if current_char == '\n':  # Checks if the current character is a new line which then increments the line number and resets the column number
-            self.line_num += 1
-            self.col_num = 0
+    @property
+    def line_num(self):
+        return self.source.line_and_column(self.index)[0]
+
+    @property
+    def col_num(self):
+        return self.source.line_and_column(self.index)[1]
+
+    @property
+    def file_name(self):
+        return self.source.file_name
 
+    @property
+    def file_text(self):
+        return self.source.text
+
+    def advance(self, current_char = None):  # Advances into the next index, line and column numbers follow from the index
+        self.index += 1
         return self
 
     def copy(self):  # Creates a copy of the position
-        return Position(self.index, self.line_num, self.col_num, self.file_name, self.file_text)
+        return Position(self.index, self.source)
+
+
+class StreamPosition(Position):  # A position in a stream, its line and column are kept as the text before it may be gone by the time they're needed
+    __slots__ = ('line', 'column')
+
+    def __init__(self, index, source, line, column):
+        self.index = index
+        self.source = source
+        self.line = line
+        self.column = column
+
+    @property
+    def line_num(self):
+        return self.line
+
+    @property
+    def col_num(self):
+        return self.column
+
+    def advance(self, current_char = None):
+        self.index += 1
+        self.column += 1
+        return self
+
+    def copy(self):
+        return StreamPosition(self.index, self.source, self.line, self.column)
 
 
 
@@ -95,15 +204,41 @@ T_RBRAC = 'RBRAC'
 T_IDENTIFIER = 'IDENTIFIER'
 T_KEYWORD = 'KEYWORD'
 T_EQ = 'EQ'
+T_NEWLINE = 'NEWLINE'  # Separates statements, either a new line or a ':'
 T_EOF = 'EOF'  # Allows us to detect if we've reached the end of the file inside the parser
 
 KEYWORDS = [
     "VAR"
 ]
 
+SINGLE_CHAR_TOKENS = {  # Maps the single character tokens to their token types
+    '+': T_PLUS,
+    '-': T_MINUS,
+    '*': T_MUL,
+    '/': T_DIV,
+    '(': T_LBRAC,
+    ')': T_RBRAC,
+    '^': T_POWER,
+    '=': T_EQ,
+    '\n': T_NEWLINE,
+    ':': T_NEWLINE,
+}
+
+TOKEN_REGEX = re.compile(  # One master regex for the lexer, the first group that matches at each index decides the token type
+    r"(?P<SKIP>[ \t]+)"  # Spaces and tabs are ignored
+    r"|(?P<NUMBER>[0-9]+(?:\.[0-9]*)?)"  # A number can contain at most one dot, a second dot is picked up as an illegal character
+    r"|(?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)"
+    r"|(?P<OP>[-+*/()^=])"
+    r"|(?P<NEWLINE>[\n:])"
+    r"|(?P<ILLEGAL>.)",
+    re.DOTALL
+)
+
 
 # Token Class
 class Token:
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value = None, pos_start = None, pos_end = None):
         self.type = type_  # This will denote what the token type is eg INT, PLUS, STRING etc...
         self.value = value  # The value of the token acquired from the input
@@ -125,6 +260,49 @@ class Token:
         return f"{self.type}"
 
 
+# Token buffer class
+TOKEN_TYPES = [T_INT, T_FLOAT, T_PLUS, T_MINUS, T_MUL, T_DIV, T_POWER, T_LBRAC, T_RBRAC, T_IDENTIFIER, T_KEYWORD, T_EQ, T_NEWLINE, T_EOF]  # Indexed by the code of each token type
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+(TC_INT, TC_FLOAT, TC_PLUS, TC_MINUS, TC_MUL, TC_DIV, TC_POWER, TC_LBRAC, TC_RBRAC, TC_IDENTIFIER, TC_KEYWORD, TC_EQ, TC_NEWLINE, TC_EOF) = range(len(TOKEN_TYPES))
+SINGLE_CHAR_CODES = {char: TOKEN_CODES[token_type] for char, token_type in SINGLE_CHAR_TOKENS.items()}
+
+class TokenBuffer:
+    """
+    The tokens of a program stored as columns instead of as Token objects: the code of each token's type in a byte array, its start and end
+    offsets in arrays of unsigned ints and its value (None for operators) in a list, which is a few bytes per token instead of a Token and
+    two Positions. The parser reads the columns directly, a Token is only made for a token which ends up in the tree or in an error, or
+    when the buffer is indexed or iterated, e.g. for debugging.
+    """
+    __slots__ = ('source', 'types', 'starts', 'ends', 'values')
+
+    def __init__(self, source):
+        self.source = source
+        offset = 'I' if len(source.text) < 1 << 32 else 'Q'  # An int is 4 bytes, only a text of 4 GB or more needs bigger offsets
+        self.types = array('B')
+        self.starts = array(offset)
+        self.ends = array(offset)
+        self.values = []
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0: index += len(self.types)
+        if not 0 <= index < len(self.types): raise IndexError("token index out of range")
+        return self.token(index)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self.token(index)
+
+    def token(self, index):  # Makes the Token at the index
+        source = self.source
+        token = Token(TOKEN_TYPES[self.types[index]], self.values[index])
+        token.pos_start = Position(self.starts[index], source)
+        token.pos_end = Position(self.ends[index], source)
+        return token
+
+
 
 
 # Lexer Class
@@ -132,7 +310,8 @@ class Lexer:
     def __init__(self, file_name, text):  # The raw text input will be passed into the constructor so it can be processed into its relevant tokens
         self.file_name = file_name
         self.text = text
-        self.pos = Position(-1, 0, -1, file_name, text)  # Keeps track of the current position of the character in the text, the file name and contents and the index and column numbers are initialised to -1 so it can be looped through later
+        self.source = Source(file_name, text)  # Shared by all the positions made by this lexer
+        self.pos = Position(-1, self.source)  # Keeps track of the current position of the character in the text, the index is initialised to -1 so it can be looped through later
         self.current_char = None
         self.advance()  # Calls the advance method described below to change the position to 0 to start at the begining of the text
         
@@ -140,7 +319,57 @@ class Lexer:
         self.pos.advance(self.current_char)
         self.current_char = self.text[self.pos.index] if self.pos.index < len(self.text) else None  # Checks that a higher index exists and increments to it unless its the final character where its set to None when incremented past
 
-    def make_tokens(self):  # Creates the tokens by analysing the data in the input text
+    def make_tokens(self, errors=None):
+        """
+        Creates the tokens by matching the whole input against one precompiled regex, into a TokenBuffer instead of a list of Tokens.
+        Lexing stops at the first illegal character, unless a list of errors is passed: then every illegal character is added to it and
+        skipped, so all of them are found in one pass (see check_program).
+        """
+        text = self.text
+        source = self.source
+        tokens = TokenBuffer(source)
+        add_type = tokens.types.append
+        add_start = tokens.starts.append
+        add_end = tokens.ends.append
+        add_value = tokens.values.append
+        names = {}  # Every use of an identifier shares one string
+
+        for match in TOKEN_REGEX.finditer(text):
+            kind = match.lastgroup
+            if kind == "SKIP":
+                continue
+            index, end = match.span()
+            value = match.group()
+
+            if kind == "OP" or kind == "NEWLINE":
+                add_type(SINGLE_CHAR_CODES[value])
+                value = None
+            elif kind == "NUMBER":
+                if '.' in value:
+                    add_type(TC_FLOAT)
+                    value = float(value)
+                else:
+                    add_type(TC_INT)
+                    value = int(value)
+            elif kind == "IDENTIFIER":
+                add_type(TC_KEYWORD if value in KEYWORDS else TC_IDENTIFIER)
+                value = names.setdefault(value, value)
+            else:  # The ILLEGAL group matches any single character which no other group accepts
+                error = IllegalCharError(Position(index, source), Position(end, source), "'" + value + "'")
+                if errors is None: return [], error
+                errors.append(error)
+                continue
+            add_start(index)
+            add_end(end)
+            add_value(value)
+
+        add_type(TC_EOF)  # Like the Token constructor, the EOF token ends one past its start
+        add_start(len(text))
+        add_end(len(text) + 1)
+        add_value(None)
+        return tokens, None
+
+    def make_tokens_charwise(self):  # The original character by character lexer, kept as the reference implementation for make_tokens
         tokens = []  # An empty list to hold the tokens
         while self.current_char is not None:  # Loops through all the characters in the text
             if self.current_char in " \t":  # Checks for spaces and tabs and ignores them
@@ -173,6 +402,9 @@ class Lexer:
             elif self.current_char == '=':
                 tokens.append(Token(T_EQ, pos_start = self.pos))
                 self.advance()
+            elif self.current_char in ":\n":  # Statements are separated by new lines or colons
+                tokens.append(Token(T_NEWLINE, pos_start = self.pos))
+                self.advance()
             else:  # If we cant find a complementary token for the input character, then we have to raise an error
                 pos_start = self.pos.copy()  # Makes a copy position object at the beginning of the error
                 char = self.current_char  # Stores the illegal character
@@ -197,9 +429,9 @@ class Lexer:
             self.advance()
 
         if dot_count == 0:  # Checks if the dot count is zero meaning that the number must be an integer
-            return Token(T_INT, int(num_str), pos_start, self.pos)
+            return Token(T_INT, int(num_str), pos_start, self.pos.copy())  # The end position is copied, otherwise it would keep moving with the lexer
         else:  # If the number does have a decimal point then it must a floating point number
-            return Token(T_FLOAT, float(num_str), pos_start, self.pos)
+            return Token(T_FLOAT, float(num_str), pos_start, self.pos.copy())
 
     def make_identifier(self):
         identifier_str = ""
@@ -210,12 +442,98 @@ class Lexer:
             self.advance()
 
         tok_type  = T_KEYWORD if identifier_str in KEYWORDS else T_IDENTIFIER
-        return Token(tok_type, identifier_str, pos_start, self.pos)
+        return Token(tok_type, identifier_str, pos_start, self.pos.copy())
+
+
+
+# Stream lexer class
+class StreamLexer:
+    """
+    Lexes a file object (or a memory mapped file, whose bytes are decoded as UTF-8) chunk by chunk, yielding the tokens as they are found
+    instead of building a list, so a parser can consume the program while it is still being read. It matches the same TOKEN_REGEX as
+    Lexer.make_tokens. A match which reaches the end of the chunk could carry on into the next one, so it is held back until more text
+    has been read. An illegal character ends the stream with an EOF token and sets error, which takes precedence over what the parser makes of the cut short stream.
+    """
+    def __init__(self, file_name, file, chunk_size=1 << 16, window_size=1 << 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.source = StreamSource(file_name, window_size)
+        self.error = None
+        self.decoder = None
+        self.at_end = False
+
+    def read_chunk(self):  # Reads the next chunk of text into the source, an empty chunk means the end of the stream
+        chunk = self.file.read(self.chunk_size)
+        self.at_end = not chunk
+        if isinstance(chunk, (bytes, bytearray)):
+            if self.decoder is None: self.decoder = codecs.getincrementaldecoder("utf-8")()  # A character can be split between two chunks of bytes
+            chunk = self.decoder.decode(chunk, final=self.at_end)
+        self.source.append(chunk)
+        return chunk
+
+    def finish_line(self):  # Reads on to the end of the current line (or the window), so an error message can show the whole line
+        read = 0
+        while not self.at_end and read < self.source.window_size:
+            chunk = self.read_chunk()
+            read += len(chunk)
+            if '\n' in chunk: break
+
+    def make_tokens(self):
+        source = self.source
+        buffer = ""  # The text read but not lexed yet, starting at index offset
+        offset = 0
+        line_num = 0
+        line_start = 0  # Index of the first character of the current line
+
+        while not self.at_end:
+            chunk = self.read_chunk()
+            at_end = self.at_end
+            buffer += chunk
+
+            lexed = len(buffer)
+            for match in TOKEN_REGEX.finditer(buffer):
+                kind = match.lastgroup
+                start, end = match.span()
+                if end == len(buffer) and not at_end and kind in ("SKIP", "NUMBER", "IDENTIFIER"):  # Could carry on in the next chunk
+                    lexed = start
+                    break
+                if kind == "SKIP":
+                    continue
+                value = match.group()
+                pos_start = StreamPosition(offset + start, source, line_num, offset + start - line_start)
+                pos_end = StreamPosition(offset + end, source, line_num, offset + end - line_start)
+
+                if kind == "OP":
+                    token = Token(SINGLE_CHAR_TOKENS[value])
+                elif kind == "NEWLINE":
+                    token = Token(T_NEWLINE)
+                    if value == '\n':
+                        line_num += 1
+                        line_start = offset + end
+                elif kind == "NUMBER":
+                    token = Token(T_FLOAT, float(value)) if '.' in value else Token(T_INT, int(value))
+                elif kind == "IDENTIFIER":
+                    token = Token(T_KEYWORD if value in KEYWORDS else T_IDENTIFIER, value)
+                else:
+                    self.error = IllegalCharError(pos_start, pos_end, "'" + value + "'")
+                    yield Token(T_EOF, pos_start = pos_start)
+                    return
+
+                token.pos_start = pos_start
+                token.pos_end = pos_end
+                yield token
+
+            offset += lexed
+            buffer = buffer[lexed:]
+
+        yield Token(T_EOF, pos_start = StreamPosition(offset, source, line_num, offset - line_start))
 
 
 
 # Nodes class
 class NumberNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):  # This will take in a number token (int or float)
         self.tok = tok
 
@@ -227,23 +545,31 @@ class NumberNode:
 
 
 class VarAccessNode:
+    __slots__ = ('var_name_token', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_token):
         self.var_name_token = var_name_token
+        self.slot = None  # The index of the variable in the frame of a run, set by the Resolver
 
         self.pos_start = self.var_name_token.pos_start
         self.pos_end = self.var_name_token.pos_end
 
 
 class VarAssignNode:
+    __slots__ = ('var_name_token', 'value_node', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_token, value_node):
         self.var_name_token = var_name_token
         self.value_node = value_node
+        self.slot = None
 
         self.pos_start = self.var_name_token.pos_start
         self.pos_end = self.value_node.pos_end
 
 
 class BinaryOpNode:  # This class will be for add, subtract, multiply and divide operations
+    __slots__ = ('left_node', 'op_token', 'right_node', 'pos_start', 'pos_end')
+
     def __init__(self, left_node, op_token, right_node):  # This will take in the left node, the operation token and the right node
         self.left_node = left_node  # The number on the left of the operator
         self.op_token = op_token  # The operator
@@ -257,6 +583,8 @@ class BinaryOpNode:  # This class will be for add, subtract, multiply and divide
 
 
 class UnaryOpNode:  # This class allows us to implement the second and third factor types in the grammar text file (e.g. -5 and bracket functionality e.g. (5+3)*2)
+    __slots__ = ('op_token', 'node', 'pos_start', 'pos_end')
+
     def __init__(self, op_token, node):
         self.op_token = op_token
         self.node = node
@@ -269,6 +597,40 @@ class UnaryOpNode:  # This class allows us to implement the second and third fac
 
 
 
+class StatementsNode:  # The statements of a program with more than one, separated by new lines or colons
+    __slots__ = ('statement_nodes', 'pos_start', 'pos_end')
+
+    def __init__(self, statement_nodes):
+        self.statement_nodes = statement_nodes
+
+        self.pos_start = self.statement_nodes[0].pos_start
+        self.pos_end = self.statement_nodes[-1].pos_end
+
+    def __repr__(self):
+        return f"[{', '.join(map(repr, self.statement_nodes))}]"
+
+
+# Tree traversal
+def node_children(node):  # The child nodes of a node in the order they are evaluated
+    node_type = type(node)
+    if node_type is BinaryOpNode: return (node.left_node, node.right_node)
+    if node_type is UnaryOpNode: return (node.node,)
+    if node_type is VarAssignNode: return (node.value_node,)
+    if node_type is StatementsNode: return tuple(node.statement_nodes)
+    return ()
+
+
+def postorder(node):  # Yields every node after its child nodes, using an explicit stack so deeply nested trees don't hit the recursion limit
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        children = node_children(node)
+        if expanded or not children:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children))
+
 
 # Parse result class (allows for easy error checking)
 class ParseResult:
@@ -297,20 +659,183 @@ class ParseResult:
 
 
 
+# Parse frame class
+class ParseFrame:  # The state of one expression which is being parsed by the iterative parser
+    __slots__ = ('bracket_idx', 'start_idx', 'assignments', 'unary_ops', 'term_left', 'term_op', 'expr_left', 'expr_op')
+
+    def __init__(self, bracket_idx, start_idx):
+        self.bracket_idx = bracket_idx  # Index of the '(' token which opened the expression, None for the whole program
+        self.start_idx = start_idx  # Index of the token the expression starts at, after any 'VAR name =' assignments
+        self.assignments = []  # The variable name tokens of the expression's 'VAR name =' assignments
+        self.unary_ops = []  # The '+' and '-' tokens waiting for the next factor
+        self.term_left = None  # The left side and operator of a term waiting for its next factor
+        self.term_op = None
+        self.expr_left = None  # The left side and operator of the expression waiting for its next term
+        self.expr_op = None
+
+
 # Parser class
 class Parser:
     def __init__(self, tokens):
+        """
+        The tokens can be a TokenBuffer, a list of Tokens or a stream of them such as StreamLexer.make_tokens(), only the current token is
+        looked at. The parser compares the code of the current token's type (see TOKEN_TYPES), so the columns of a TokenBuffer are read
+        directly and a Token is only made when current_token is asked for, for a node of the tree or an error.
+        """
         self.tokens = tokens
+        if type(tokens) is TokenBuffer:
+            self.types = tokens.types
+            self.last_idx = len(tokens) - 1  # The EOF token
+            self.token_stream = None
+        else:
+            self.types = None
+            self.token_stream = iter(tokens)
         self.token_idx = -1  # Will keep track of the index of the token (similar to Lexer)
+        self.code = None  # The code of the current token's type
+        self.stream_token = None  # The current token, when the tokens are a list or a stream
+        self.statement_idx = 0  # Index of the token the current statement began at
         self.advance()
 
     def advance(self):
         self.token_idx += 1
-        if self.token_idx < len(self.tokens):  # If the index is in range of the tokens
-            self.current_token = self.tokens[self.token_idx]  # Grab that current token
-        return self.current_token
+        if self.types is not None:
+            if self.token_idx <= self.last_idx:  # Past the end the parser stays on the final EOF token
+                self.code = self.types[self.token_idx]
+            return
+        token = next(self.token_stream, None)
+        if token is not None:
+            self.stream_token = token  # Grab that current token
+            self.code = TOKEN_CODES[token.type]
+
+    @property
+    def current_token(self):
+        if self.stream_token is not None:
+            return self.stream_token
+        index = self.token_idx
+        return self.tokens.token(index if index < self.last_idx else self.last_idx)
+
+    def syntax_error(self, details):  # A syntax error at the current token
+        token = self.current_token
+        return InvalidSyntaxError(token.pos_start, token.pos_end, details)
+
+    def parse(self):  # Parses the whole program, a program with one statement is just that statement's node
+        statement_nodes = []
+        for statement in self.statements():
+            if statement.error: return statement
+            statement_nodes.append(statement.node)
+        if len(statement_nodes) == 1:
+            return statement
+        return ParseResult().success(StatementsNode(statement_nodes))
+
+    def statements(self, recover=False):
+        """
+        Yields a ParseResult for each statement as soon as it is parsed, stopping after the first error. Statements are separated
+        by one or more new lines or colons. Only the tokens up to the end of a statement have been read when it is yielded, so
+        statements from a stream can be run before the rest of it arrives. With recover=True parsing carries on after an error at the
+        next separator, so every statement with a syntax error is yielded. statement_idx is the index of the token the statement began at.
+        """
+        while self.code == TC_NEWLINE:
+            self.advance()
+        while True:
+            self.statement_idx = self.token_idx
+            statement = self.statement()
+            yield statement
+            if statement.error and recover:
+                while self.code != TC_NEWLINE and self.code != TC_EOF:  # The rest of the statement can't be parsed, so it is skipped
+                    self.advance()
+            elif statement.error:
+                return
+            if self.code == TC_EOF:
+                return
+            while self.code == TC_NEWLINE:  # The statement ended at a separator
+                self.advance()
+            if self.code == TC_EOF:
+                return
 
-    def parse(self):
+    def statement(self):
+        """
+        Parses one statement in one loop with an explicit stack of the bracketed expressions which are still open, instead of recursing
+        through expr, term and factor. How deeply brackets and unary operators can be nested is only bounded by memory, and for a single
+        statement it builds the same tree and reports the same syntax errors as parse_recursive.
+        """
+        result = ParseResult()
+        frames = []  # The enclosing expressions, waiting for the bracketed expression in frame to be closed
+        frame = ParseFrame(None, self.token_idx)
+        expr_start = True  # Whether the current token starts an expression, which is the only place 'VAR' can appear
+        advance = self.advance
+        token_at = self.tokens.token if self.types is not None else lambda index: self.stream_token  # Makes the Token at an index before the EOF
+
+        while True:
+            code = self.code
+
+            if expr_start and code == TC_KEYWORD and self.current_token.value == 'VAR':
+                advance()
+                if self.code != TC_IDENTIFIER:
+                    return result.failure(self.syntax_error("Expected identifier"))
+                frame.assignments.append(token_at(self.token_idx))
+                advance()
+                if self.code != TC_EQ:
+                    return result.failure(self.syntax_error("Expected '='"))
+                advance()
+                frame.start_idx = self.token_idx  # The assigned value is an expression of its own
+                continue
+            expr_start = False
+
+            # Factors
+            if code == TC_PLUS or code == TC_MINUS:
+                frame.unary_ops.append(token_at(self.token_idx))
+                advance()
+                continue
+            elif code == TC_LBRAC:
+                bracket_idx = self.token_idx
+                advance()
+                frames.append(frame)
+                frame = ParseFrame(bracket_idx, self.token_idx)
+                expr_start = True
+                continue
+            elif code == TC_IDENTIFIER:
+                node = VarAccessNode(token_at(self.token_idx))
+            elif code == TC_INT or code == TC_FLOAT:
+                node = NumberNode(token_at(self.token_idx))
+            elif self.token_idx == frame.start_idx:  # Nothing of the expression was parsed yet, like the recursive parser's expr reports
+                return result.failure(self.syntax_error("Expected 'VAR', int, float, identifier, '+', '-' or '('"))
+            else:
+                return result.failure(self.syntax_error("Expected int, float, identifier, '+', '-' or '('"))
+            advance()
+
+            # The node is a complete factor, so it is combined with the operators before it until one is found which needs another factor
+            while True:
+                while frame.unary_ops:
+                    node = UnaryOpNode(frame.unary_ops.pop(), node)
+                if frame.term_op:
+                    node = BinaryOpNode(frame.term_left, frame.term_op, node)
+                code = self.code
+                if code == TC_MUL or code == TC_DIV or code == TC_POWER:
+                    frame.term_left, frame.term_op = node, token_at(self.token_idx)
+                    advance()
+                    break
+                frame.term_op = None
+
+                if frame.expr_op:  # The term is complete
+                    node = BinaryOpNode(frame.expr_left, frame.expr_op, node)
+                if code == TC_PLUS or code == TC_MINUS:
+                    frame.expr_left, frame.expr_op = node, token_at(self.token_idx)
+                    advance()
+                    break
+                frame.expr_op = None
+
+                for var_name in reversed(frame.assignments):  # The expression is complete
+                    node = VarAssignNode(var_name, node)
+                if frame.bracket_idx is None:
+                    if code != TC_NEWLINE and code != TC_EOF:  # If the statement isn't followed by a separator or the end of the file, there was left over code to parse therefore there must've been a syntax error
+                        return result.failure(self.syntax_error("Expected a valid arithmetic operator!"))
+                    return result.success(node)
+                if code != TC_RBRAC:
+                    return result.failure(self.syntax_error("Expected ')'"))
+                advance()
+                frame = frames.pop()  # The bracketed expression is a factor of the enclosing one
+
+    def parse_recursive(self):  # The original recursive descent parser, kept as the reference implementation for parse
         res = self.expr()
         if not res.error and self.current_token.type != T_EOF:  # If the final token type is not the end of file error, there was left over code to parse therefore there must've been a syntax error
             return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected a valid arithmetic operator!"))
@@ -417,8 +942,197 @@ class RunTimeResult:  # This class will keep track of the current result and err
         self.error = error
         return self
 
+# Numeric backend classes
+DEFAULT_MAX_BITS = 14_000  # Just under the 4300 digits Python converts an int to a string with by default, so every result can be printed
+
+
+class NumberError(ArithmeticError):  # Raised by a numeric backend for a result it won't work out, the engines turn it into a runtime error
+    pass
+
+
+class BitLimitError(NumberError):  # Raised for an integer over the backend's max_bits, which is reported as a LimitError
+    def __init__(self, max_bits):
+        super().__init__(f"Number is over the limit of {max_bits} bits!")
+
+
+def number_error(exception, pos_start, pos_end, context):  # The runtime error for an arithmetic exception raised by a numeric backend
+    if isinstance(exception, BitLimitError): return LimitError(pos_start, pos_end, str(exception), context)
+    if isinstance(exception, NumberError): details = str(exception)
+    elif isinstance(exception, ZeroDivisionError): details = "Division by 0!"  # E.g. 0 to a negative power
+    else: details = "Number too large!"  # An OverflowError, e.g. a float power out of range or an int too big to divide
+    return RunTimeError(pos_start, pos_end, details, context)
+
+
+class PythonNumbers:
+    """
+    The default numeric backend, Python's unbounded ints and floats where a division always gives a float. Integer results are limited
+    to max_bits, and the size of an integer product or power is worked out from the bit lengths of its operands before it is computed,
+    so 2^1000000 or (2^2)^(2^20) fails straight away instead of taking a worker down. The engines pass raw values to a backend and turn
+    the ArithmeticErrors it raises into runtime errors, every engine uses the backend of the context it runs in.
+    """
+    name = "python"
+    negation_overflows = False  # Whether negating a number can fail, in which case --x can't be simplified to x
+
+    def __init__(self, max_bits=DEFAULT_MAX_BITS):
+        self.max_bits = max_bits
+
+    @property
+    def key(self):  # Identifies the backend and its limits, which constant folding depends on
+        return (self.name, self.max_bits)
+
+    def literal(self, value):  # Converts the value of a number literal (an int or float) into the backend's representation, within the limits
+        return self.check(value)
+
+    def check(self, value):  # Returns the value if it is within the limits, or raises an error
+        if type(value) is int and value.bit_length() > self.max_bits:
+            raise BitLimitError(self.max_bits)
+        return value
+
+    # The checks are inlined in the operations the engines call the most
+    def add(self, left, right):
+        value = left + right
+        if type(value) is int and value.bit_length() > self.max_bits:
+            raise BitLimitError(self.max_bits)
+        return value
+
+    def subtract(self, left, right):
+        value = left - right
+        if type(value) is int and value.bit_length() > self.max_bits:
+            raise BitLimitError(self.max_bits)
+        return value
+
+    def multiply(self, left, right):
+        if type(left) is int and type(right) is int:
+            if left.bit_length() + right.bit_length() - 1 > self.max_bits:  # The product has at least this many bits, checked before working it out
+                raise BitLimitError(self.max_bits)
+            value = left * right
+            if value.bit_length() > self.max_bits:
+                raise BitLimitError(self.max_bits)
+            return value
+        return self.check(left * right)
+
+    def divide(self, left, right):  # The engines check for a division by 0 themselves, so the error points at the divisor
+        return left / right
+
+    def power(self, left, right):
+        if type(left) is int and type(right) is int and right > 1 and (abs(left).bit_length() - 1) * right > self.max_bits:  # A base of b bits gives at least (b - 1) * right + 1 bits
+            raise BitLimitError(self.max_bits)
+        return self.check(pow(left, right))
+
+    def negate(self, value):
+        return self.check(value * -1)
+
+
+class Int64Numbers(PythonNumbers):  # Integers are signed 64 bit and going out of range is an error instead of growing, floats are unchanged
+    name = "int64"
+    negation_overflows = True  # -(-2^63) is out of range
+    MIN = -1 << 63
+    MAX = (1 << 63) - 1
+
+    def __init__(self):
+        super().__init__(64)
+
+    def check(self, value):
+        if type(value) is int and not self.MIN <= value <= self.MAX:
+            raise NumberError("Integer overflow!")
+        return value
+
+    def add(self, left, right):
+        return self.check(left + right)
+
+    def subtract(self, left, right):
+        return self.check(left - right)
+
+    def multiply(self, left, right):  # The operands are at most 64 bits, so the product is cheap to work out and check
+        return self.check(left * right)
+
+    def power(self, left, right):
+        if type(left) is int and type(right) is int and right > 1 and (abs(left).bit_length() - 1) * right > 63:
+            raise NumberError("Integer overflow!")
+        return self.check(pow(left, right))
+
+
+class ExactNumbers(PythonNumbers):
+    """
+    Exact arithmetic with fractions.Fraction: float literals are the fraction their digits spell (0.1 is exactly 1/10), a division
+    of exact numbers is a fraction and a whole result is kept as an int. A power with an exponent which isn't whole gives a float, like
+    Fraction does. The max_bits limit applies to the numerator and denominator of a fraction.
+    """
+    name = "exact"
+
+    def literal(self, value):
+        if type(value) is float:
+            if math.isinf(value): raise NumberError("Number too large!")  # A literal with too many digits for a float
+            return self.check(Fraction(repr(value)))
+        return self.check(value)
+
+    def check(self, value):
+        if type(value) is Fraction:
+            if value.denominator == 1:
+                value = value.numerator
+            elif max(abs(value.numerator).bit_length(), value.denominator.bit_length()) > self.max_bits:
+                raise BitLimitError(self.max_bits)
+        if type(value) is int and value.bit_length() > self.max_bits:
+            raise BitLimitError(self.max_bits)
+        return value
+
+    def divide(self, left, right):
+        if type(left) in (int, Fraction) and type(right) in (int, Fraction):
+            return self.check(Fraction(left) / right)
+        return left / right
+
+    def power(self, left, right):
+        if type(left) in (int, Fraction) and type(right) is int:
+            base_bits = max(abs(left.numerator).bit_length(), left.denominator.bit_length())
+            if (base_bits - 1) * abs(right) > self.max_bits:
+                raise BitLimitError(self.max_bits)
+            if right < 0: left = Fraction(left)  # An int to a negative power is a fraction, e.g. 2^-1 is 1/2
+            return self.check(left ** right)
+        return self.check(pow(left, right))
+
+
+class FloatNumbers(PythonNumbers):  # Every number is a float, the fastest backend as nothing is checked, a float overflowing to inf is not an error
+    name = "float"
+
+    def __init__(self):
+        super().__init__(None)
+
+    def literal(self, value):  # An int literal too big for a float raises an OverflowError
+        return float(value)
+
+    def add(self, left, right):
+        return left + right
+
+    def subtract(self, left, right):
+        return left - right
+
+    def multiply(self, left, right):
+        return left * right
+
+    def power(self, left, right):
+        value = left ** right  # A float power out of range raises an OverflowError
+        if type(value) is complex:
+            raise NumberError("The power of a negative number has no real value!")
+        return value
+
+    def negate(self, value):
+        return value * -1
+
+
+NUMBER_BACKENDS = {  # The numeric backends a session can use, by name
+    "python": PythonNumbers,
+    "int64": Int64Numbers,
+    "exact": ExactNumbers,
+    "float": FloatNumbers,
+}
+
+default_numbers = PythonNumbers()  # Used by run() and by any context which doesn't pick a backend
+
+
 # Number class
 class Number:  # This class will be for storing numbers and then operating on them with numbers
+    __slots__ = ('value', 'pos_start', 'pos_end', 'context')
+
     def __init__(self, value):
         self.value = value
         self.set_position()  # This is to track the position of the number in case of a mathematical error e.g. division by 0
@@ -433,27 +1147,39 @@ class Number:  # This class will be for storing numbers and then operating on th
         self.context = context
         return self
 
-    def added_to(self, other):
+    def added_to(self, other, numbers=None):  # The numbers argument is the numeric backend to use, the default one if it isn't given
         if isinstance(other, Number):  # Checks if the types of the two objects to be added is the same
-            return Number(self.value + other.value).set_context(self.context), None  # Created new number object with the operation of the function applied
+            return self.operated_on(other, (numbers or default_numbers).add)  # Created new number object with the operation of the function applied
 
-    def subtracted_by(self, other):
+    def subtracted_by(self, other, numbers=None):
         if isinstance(other, Number):
-            return Number(self.value - other.value).set_context(self.context), None  # The second return is the error which for these operations is none
+            return self.operated_on(other, (numbers or default_numbers).subtract)  # The second return is the error, if the backend raised one
 
-    def multiplied_by(self, other):
+    def multiplied_by(self, other, numbers=None):
         if isinstance(other, Number):
-            return Number(self.value * other.value).set_context(self.context), None
+            return self.operated_on(other, (numbers or default_numbers).multiply)
 
-    def divided_by(self, other):
+    def divided_by(self, other, numbers=None):
         if isinstance(other, Number):
             if other.value == 0:
                 return None, RunTimeError(other.pos_start, other.pos_end, "Division by 0!", self.context)
-            return Number(self.value / other.value).set_context(self.context), None
+            return self.operated_on(other, (numbers or default_numbers).divide)
 
-    def power_to(self, other):
+    def power_to(self, other, numbers=None):
         if isinstance(other, Number):
-            return Number(pow(self.value, other.value)).set_context(self.context), None
+            return self.operated_on(other, (numbers or default_numbers).power)
+
+    def negated(self, numbers=None):
+        try:
+            return Number((numbers or default_numbers).negate(self.value)).set_context(self.context), None
+        except ArithmeticError as exception:
+            return None, number_error(exception, self.pos_start, self.pos_end, self.context)
+
+    def operated_on(self, other, operation):  # An error from the backend, e.g. an overflow, points at both operands
+        try:
+            return Number(operation(self.value, other.value)).set_context(self.context), None
+        except ArithmeticError as exception:
+            return None, number_error(exception, self.pos_start, other.pos_end, self.context)
 
     def copy(self):
         copy = Number(self.value)
@@ -476,6 +1202,8 @@ class Context:  # This is a class to track the current context of the program
         self.parent = parent
         self.parent_entry_pos = parent_entry_pos
         self.symbol_table = None
+        self.numbers = default_numbers  # The numeric backend the engines do arithmetic with
+        self.budget = None  # The RunBudget of the run in this context, None if it runs without limits
 
 
 # Symbol table class
@@ -484,11 +1212,16 @@ class SymbolTable:  # This is a class to track the variable names and their valu
         self.symbols = {}
         self.parent = None  # Symbol table for global variables
 
-    def get(self, name):
-        value = self.symbols.get(name, None)
-        if value == None and self.parent:
-           return self.parent.get(name)
-        return value
+    def get(self, name):  # Returns None only for a name which isn't defined in this table or the tables it falls back to, a value of 0 is still a value
+        table = self
+        while table is not None:
+            value = table.symbols.get(name)
+            if value is not None: return value
+            table = table.parent
+        return None
+
+    def lookup(self, names):  # The value of each name (None if it isn't defined), which a run then reads by slot instead of by name
+        return [self.get(name) for name in names]
 
     def set(self, name, value):
         self.symbols[name] = value
@@ -498,6 +1231,114 @@ class SymbolTable:  # This is a class to track the variable names and their valu
 
 
 
+# Limits class
+class Limits:
+    """
+    The resources one run of a program may use, None means unlimited. max_steps bounds the nodes visited (or the instructions executed
+    by the virtual machine), timeout the seconds spent running, max_bits the bit length of any integer (it lowers the max_bits of the numeric
+    backend, the int64 backend keeps its 64 bit range) and max_source and max_tokens the size of the program. Breaking a limit stops the
+    run with a LimitError.
+    """
+    def __init__(self, max_steps=None, timeout=None, max_bits=None, max_source=None, max_tokens=None):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_bits = max_bits
+        self.max_source = max_source
+        self.max_tokens = max_tokens
+
+    def report(self):  # The limits as a dictionary, keyed like Session.usage()
+        return {"steps": self.max_steps, "seconds": self.timeout, "bits": self.max_bits, "source": self.max_source, "tokens": self.max_tokens}
+
+
+# Run budget class
+class RunBudget:
+    """
+    Tracks one run under some Limits, shared by the statements of the run, and what it used of them. The engines count their steps and
+    only call check once the count reaches the step next_check returned, which is at most CHECK_INTERVAL steps away, so the hot loops
+    pay for one comparison per step and the clock is read rarely. A run in a context without a budget isn't checked at all.
+    """
+    CHECK_INTERVAL = 1024
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.steps = 0  # Steps taken so far, the engines store their count here when they stop
+        self.start = perf_counter()
+        self.deadline = self.start + limits.timeout if limits.timeout is not None else None
+        self.source = 0  # Characters of source in the run
+        self.tokens = 0  # Tokens in the run
+        self.bits = 0  # Bit length of the biggest integer the run returned
+        self.error = None  # The error the run ended with, if any
+
+    def next_check(self, step):  # The step at which check has to be called next
+        next_check = step + self.CHECK_INTERVAL
+        max_steps = self.limits.max_steps
+        if max_steps is not None and max_steps < next_check:
+            next_check = max_steps + 1
+        return next_check
+
+    def check(self, step, pos_start, pos_end, context):  # Returns a LimitError if taking the step breaks a limit
+        if self.limits.max_steps is not None and step > self.limits.max_steps:
+            return LimitError(pos_start, pos_end, f"Step limit of {self.limits.max_steps} reached!", context)
+        if self.deadline is not None and perf_counter() > self.deadline:
+            return LimitError(pos_start, pos_end, f"Time limit of {self.limits.timeout}s reached!", context)
+        return None
+
+    def returned(self, value, error):  # Notes the value and error a run (or one of its statements) returned, and passes them on
+        if error is not None:
+            self.error = error
+        elif value is not None:
+            number = value.value
+            if type(number) is int:
+                self.bits = max(self.bits, number.bit_length())
+            elif type(number) is Fraction:
+                self.bits = max(self.bits, number.numerator.bit_length(), number.denominator.bit_length())
+        return value, error
+
+    def usage(self):  # What the run used of each limit, keyed like Limits.report()
+        return {"steps": self.steps, "seconds": perf_counter() - self.start, "source": self.source, "tokens": self.tokens, "bits": self.bits}
+
+
+# Resolver class
+class Resolver:
+    """
+    Gives every variable of a tree a slot before it runs, numbering the names in the order they are first met. A run looks each name up
+    in the chain of symbol tables once, into a frame list, and the engines then read and write variables by slot instead of walking the
+    chain of dicts on every access. The statements of a program are resolved as one tree, so they share the slots of the whole program.
+    """
+    def resolve(self, node):  # Sets the slot of each variable node and returns the name of each slot
+        names = []
+        slots = {}
+        for child in postorder(node):
+            if type(child) is VarAccessNode or type(child) is VarAssignNode:
+                name = child.var_name_token.value
+                slot = slots.get(name)
+                if slot is None:
+                    slot = slots[name] = len(names)
+                    names.append(name)
+                child.slot = slot
+        return names
+
+    def used(self, node):  # The slots a tree which was resolved as part of a bigger one uses, in the order they are first met
+        return list(dict.fromkeys(child.slot for child in postorder(node) if type(child) is VarAccessNode or type(child) is VarAssignNode))
+
+
+class Resolved:  # The form the tree walking engines run, the tree (or its nodes in evaluation order) and the names of the slots of its variables
+    __slots__ = ('body', 'names', 'used')
+
+    def __init__(self, body, names, used=None):
+        self.body = body
+        self.names = names
+        self.used = used  # The slots the body uses, None if it uses all of them
+
+    def frame(self, symbol_table):  # The value of each slot at the start of a run, a statement only looks up the names it uses
+        if self.used is None:
+            return symbol_table.lookup(self.names)
+        frame = [None] * len(self.names)
+        for slot in self.used:
+            frame[slot] = symbol_table.get(self.names[slot])
+        return frame
+
+
 # Interpreter class
 class Interpreter:  # Interpreter will traverse through the node "tree" and by looking at the node types, it will determine the code to be executed
     def visit(self, node, context):
@@ -508,18 +1349,86 @@ class Interpreter:  # Interpreter will traverse through the node "tree" and by l
         method = getattr(self, method_name, self.no_visit_method)
         return method(node, context)
 
+    def prepare(self, node, names=None):  # Engines turn the syntax tree into the form they run once per program, the tree walker runs the resolved tree itself
+        if names is None: return Resolved(node, Resolver().resolve(node))
+        return Resolved(node, names, Resolver().used(node))  # A statement of a program which was resolved as a whole
+
+    def execute(self, prepared, context):
+        """
+        Runs the tree in post order, keeping the values of the child nodes on a stack instead of recursing through visit, so how deeply
+        the tree can be nested is only bounded by memory. It gives the same values and errors as visit, which is kept as the reference.
+        A tree which wasn't prepared is resolved first.
+        """
+        if type(prepared) is not Resolved: prepared = self.prepare(prepared)
+        node = prepared.body
+        frame = prepared.frame(context.symbol_table)
+        values = []
+        budget = context.budget
+        step = budget.steps if budget else 0  # Every node visited is a step
+        check_at = budget.next_check(step) if budget else math.inf
+        try:
+            for node in postorder(node):
+                step += 1
+                if step >= check_at:  # The limits are only looked at every so many steps
+                    error = budget.check(step, node.pos_start, node.pos_end, context)
+                    if error: return RunTimeResult().failure(error)
+                    check_at = budget.next_check(step)
+                error = self.evaluate(node, values, frame, context)
+                if error: return RunTimeResult().failure(error)
+        finally:
+            if budget: budget.steps = step
+        return RunTimeResult().success(values.pop())
+
+    def evaluate(self, node, values, frame, context):  # Evaluates one node whose child nodes are already on top of the values stack, returning an error if needed
+        node_type = type(node)
+        if node_type is NumberNode:
+            number, error = self.literal(node, context)
+            if error: return error
+            values.append(number)
+        elif node_type is VarAccessNode:
+            value = frame[node.slot]
+            if value is None: return RunTimeError(node.pos_start, node.pos_end, f"'{node.var_name_token.value}' is not defined!", context)
+            values.append(value.copy().set_position(node.pos_start, node.pos_end))
+        elif node_type is VarAssignNode:
+            frame[node.slot] = values[-1]  # Later reads in the run see the new value, and the symbol table keeps it for later runs
+            context.symbol_table.set(node.var_name_token.value, values[-1])
+        elif node_type is BinaryOpNode:
+            right = values.pop()
+            res, error = self.operate(node.op_token.type, values.pop(), right, context.numbers)
+            if error: return error
+            values.append(res.set_position(node.pos_start, node.pos_end))
+        elif node_type is UnaryOpNode:
+            number = values.pop()
+            if node.op_token.type == T_MINUS:
+                number, error = number.negated(context.numbers)
+                if error: return error
+            values.append(number.set_position(node.pos_start, node.pos_end))
+        elif node_type is StatementsNode:  # The program's value is the value of its last statement
+            del values[len(values) - len(node.statement_nodes):-1]
+        else:
+            self.no_visit_method(node, context)
+
     def no_visit_method(self, node, context):
         raise Exception(f"No visit_{type(node).__name__} method defined")
 
     def visit_NumberNode(self, node, context):
-        return RunTimeResult().success(Number(node.tok.value).set_context(context).set_position(node.pos_start, node.pos_end))
+        number, error = self.literal(node, context)
+        if error: return RunTimeResult().failure(error)
+        return RunTimeResult().success(number)
+
+    def literal(self, node, context):  # The Number for a number node, in the representation of the context's numeric backend
+        try:
+            value = context.numbers.literal(node.tok.value)
+        except ArithmeticError as exception:  # E.g. an int literal out of range for 64 bits
+            return None, number_error(exception, node.pos_start, node.pos_end, context)
+        return Number(value).set_context(context).set_position(node.pos_start, node.pos_end), None
 
     def visit_VarAccessNode(self, node, context):
         result = RunTimeResult()
         var_name = node.var_name_token.value
         value = context.symbol_table.get(var_name)
 
-        if not value: return result.failure(RunTimeError(node.pos_start, node.pos_end, f"'{var_name}' is not defined!", context))
+        if value is None: return result.failure(RunTimeError(node.pos_start, node.pos_end, f"'{var_name}' is not defined!", context))
 
         value = value.copy().set_position(node.pos_start, node.pos_end)
         return result.success(value)
@@ -540,23 +1449,31 @@ class Interpreter:  # Interpreter will traverse through the node "tree" and by l
         right = result.register(self.visit(node.right_node, context))
         if result.error: return result
 
-        # Now we need to check the operator type
-        if node.op_token.type == T_PLUS:
-            res, error = left.added_to(right)
-        elif node.op_token.type == T_MINUS:
-            res, error = left.subtracted_by(right)
-        elif node.op_token.type == T_MUL:
-            res, error = left.multiplied_by(right)
-        elif node.op_token.type == T_DIV:
-            res, error = left.divided_by(right)
-        elif node.op_token.type == T_POWER:
-            res, error = left.power_to(right)
-
+        res, error = self.operate(node.op_token.type, left, right, context.numbers)
         if error:
             return result.failure(error)
         else:
             return result.success(res.set_position(node.pos_start, node.pos_end))
 
+    def visit_StatementsNode(self, node, context):
+        result = RunTimeResult()
+        for statement_node in node.statement_nodes:  # Runs the statements in order, stopping at the first error
+            value = result.register(self.visit(statement_node, context))
+            if result.error: return result
+        return result.success(value)
+
+    def operate(self, op_type, left, right, numbers=None):  # Now we need to check the operator type
+        if op_type == T_PLUS:
+            return left.added_to(right, numbers)
+        elif op_type == T_MINUS:
+            return left.subtracted_by(right, numbers)
+        elif op_type == T_MUL:
+            return left.multiplied_by(right, numbers)
+        elif op_type == T_DIV:
+            return left.divided_by(right, numbers)
+        elif op_type == T_POWER:
+            return left.power_to(right, numbers)
+
     def visit_UnaryOpNode(self, node, context):
         result = RunTimeResult()
         number = result.register(self.visit(node.node, context))
@@ -564,7 +1481,7 @@ class Interpreter:  # Interpreter will traverse through the node "tree" and by l
 
         error = None
         if node.op_token.type == T_MINUS:
-            number, error = number.multiplied_by(Number(-1))  # Multiplies a number by -1 for the case of a single minus
+            number, error = number.negated(context.numbers)  # Multiplies a number by -1 for the case of a single minus
 
         if error:
             return result.failure(error)
@@ -572,25 +1489,1770 @@ class Interpreter:  # Interpreter will traverse through the node "tree" and by l
             return result.success(number.set_position(node.pos_start, node.pos_end))
 
 
-# Run functions
+# Native interpreter class
+class NativeInterpreter(Interpreter):
+    """
+    Runs the nodes of the tree in evaluation order on raw int and float values, instead of making a Number for every intermediate result. Numbers are only made
+    where they can be seen: the values stored in variables, the returned value and the errors. It gives exactly the same values, positions
+    and tracebacks as Interpreter. A Number's context comes from the leftmost number it was worked out from, which is the run's context
+    except for values such as NULL which have none, so the few values with another context are tracked by their index on the stack.
+    """
+    def prepare(self, node, names=None):  # The nodes in the order they are evaluated, flattened once so running the program doesn't walk the tree
+        if names is None: return Resolved(list(postorder(node)), Resolver().resolve(node))
+        return Resolved(list(postorder(node)), names, Resolver().used(node))
+
+    def execute(self, prepared, context):
+        nodes = prepared.body
+        frame = prepared.frame(context.symbol_table)
+        values = []
+        push = values.append
+        pop = values.pop
+        contexts = {}  # Maps the index on the stack of a value whose context isn't the run's context to its context
+        symbol_table = context.symbol_table
+        numbers = context.numbers
+        literal = numbers.literal
+        stored = None  # The Number stored by the last assignment
+        passed_on = set()  # The unary '+' nodes whose value is the Number stored by the assignment under them
+        budget = context.budget
+        step = budget.steps if budget else 0
+        check_at = budget.next_check(step) if budget else math.inf
+
+        try:
+            for node in nodes:
+                node_type = type(node)
+                step += 1
+                if step >= check_at:
+                    error = budget.check(step, node.pos_start, node.pos_end, context)
+                    if error: return RunTimeResult().failure(error)
+                    check_at = budget.next_check(step)
+                try:
+                    if node_type is BinaryOpNode:
+                        right = pop()
+                        if contexts: contexts.pop(len(values), None)
+                        op_type = node.op_token.type
+                        if op_type == T_PLUS:
+                            values[-1] = numbers.add(values[-1], right)
+                        elif op_type == T_MINUS:
+                            values[-1] = numbers.subtract(values[-1], right)
+                        elif op_type == T_MUL:
+                            values[-1] = numbers.multiply(values[-1], right)
+                        elif op_type == T_DIV:
+                            if right == 0:
+                                pos_start, pos_end = self.result_span(node.right_node)
+                                return RunTimeResult().failure(RunTimeError(pos_start, pos_end, "Division by 0!", contexts.get(len(values) - 1, context)))
+                            values[-1] = numbers.divide(values[-1], right)
+                        elif op_type == T_POWER:
+                            values[-1] = numbers.power(values[-1], right)
+                    elif node_type is NumberNode:
+                        push(literal(node.tok.value))
+                    elif node_type is VarAccessNode:
+                        value = frame[node.slot]
+                        if value is None: return RunTimeResult().failure(RunTimeError(node.pos_start, node.pos_end, f"'{node.var_name_token.value}' is not defined!", context))
+                        if value.context is not context:
+                            contexts[len(values)] = value.context
+                        push(value.value)
+                    elif node_type is UnaryOpNode:
+                        if node.op_token.type == T_MINUS:
+                            values[-1] = numbers.negate(values[-1])
+                        elif type(node.node) is VarAssignNode or node.node in passed_on:  # Like Interpreter, +(VAR a = 1) moves the Number stored in a to the position of the '+'
+                            stored.set_position(node.pos_start, node.pos_end)
+                            passed_on.add(node)
+                    elif node_type is VarAssignNode:
+                        value_node = node.value_node
+                        if type(value_node) is not VarAssignNode and value_node not in passed_on:
+                            stored = Number(values[-1]).set_context(contexts.get(len(values) - 1, context)).set_position(value_node.pos_start, value_node.pos_end)
+                        frame[node.slot] = stored
+                        symbol_table.set(node.var_name_token.value, stored)
+                    elif node_type is StatementsNode:  # The program's value is the value of its last statement
+                        first = len(values) - len(node.statement_nodes)
+                        if contexts:
+                            last = contexts.get(len(values) - 1, context)
+                            for index in [index for index in contexts if index >= first]:
+                                del contexts[index]
+                            if last is not context:
+                                contexts[first] = last
+                        del values[first:-1]
+                    else:
+                        self.no_visit_method(node, context)
+                except ArithmeticError as exception:  # Raised by the numeric backend, the error points where Interpreter's would
+                    return RunTimeResult().failure(self.number_error(node, exception, contexts.get(len(values) - 1, context), context))
+        finally:
+            if budget: budget.steps = step
+
+        pos_start, pos_end = self.result_span(nodes[-1])  # The last node is the root of the tree
+        return RunTimeResult().success(Number(values[-1]).set_context(contexts.get(0, context)).set_position(pos_start, pos_end))
+
+    def result_span(self, node):  # The position of the value of a node, an assignment has the position of its value node
+        while isinstance(node, (VarAssignNode, StatementsNode)):
+            node = node.value_node if isinstance(node, VarAssignNode) else node.statement_nodes[-1]
+        return node.pos_start, node.pos_end
+
+    def number_error(self, node, exception, operand_context, context):
+        if type(node) is NumberNode:  # A literal the backend can't represent
+            return number_error(exception, node.pos_start, node.pos_end, context)
+        if type(node) is UnaryOpNode:
+            pos_start, pos_end = self.result_span(node.node)
+        else:  # A binary operation points at both of its operands, whose context is the left one's
+            pos_start, pos_end = self.result_span(node.left_node)[0], self.result_span(node.right_node)[1]
+        return number_error(exception, pos_start, pos_end, operand_context)
+
+
+# Optimizer class
+KEEP_NONE = (False, False)  # Which ends of a node's position can be seen after the program runs, see Optimizer.visit
+KEEP_START = (True, False)
+KEEP_END = (False, True)
+KEEP_SPAN = (True, True)
+
+class Optimizer:  # Folds constant subtrees into number nodes and applies safe algebraic identities before the program is run
+    FOLD_POWER_MAX_BITS = 4096  # Integer powers with a bigger result are left for the interpreter so optimizing stays cheap
+
+    def __init__(self, numbers=None):  # Constants are folded with the numeric backend the program will run with
+        self.numbers = numbers or default_numbers
+
+    def optimize(self, node):  # Works bottom up with an explicit stack, the optimized child nodes wait on the results stack for their parent
+        results = []
+        stack = [(node, KEEP_SPAN, False)]  # Each entry is a node, its keep and whether its child nodes have been optimized already
+        while stack:
+            node, keep, expanded = stack.pop()
+            children = node_children(node)
+            if children and not expanded:
+                stack.append((node, keep, True))
+                stack.extend(reversed(list(zip(children, self.child_keeps(node), [False] * len(children)))))
+            else:
+                start = len(results) - len(children)
+                optimized = results[start:]
+                del results[start:]
+                results.append(self.visit(node, keep, optimized))
+        return results.pop()
+
+    def child_keeps(self, node):
+        node_type = type(node)
+        if node_type is BinaryOpNode: return (KEEP_START, KEEP_SPAN if node.op_token.type == T_DIV else KEEP_END)  # An error from the numeric backend spans both operands
+        if node_type is UnaryOpNode: return (KEEP_SPAN if node.op_token.type == T_MINUS else KEEP_NONE,)  # An error negating points at the operand
+        if node_type is VarAssignNode: return (KEEP_SPAN,)
+        if node_type is StatementsNode: return (KEEP_SPAN,) * len(node.statement_nodes)  # The value of every statement can be seen
+        return ()
+
+    def visit(self, node, keep, children):
+        """
+        Rebuilds a node from its already optimized child nodes. keep is a (start, end) pair of flags for the ends of the node's position which
+        can be seen after the program runs: the root node, the value of an assignment and the operand of a negation are seen whole, a division
+        by 0 error points at the right hand side of the division and an error from the numeric backend (e.g. an overflow) spans from the start
+        of the left operand to the end of the right one. An identity is only applied if the child replacing the node ends where the node does
+        at the ends which are kept, e.g. x*1 = x as a left operand but not as a right one. Folding is always fine as the folded number node
+        keeps the span of the subtree it replaces.
+        """
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node, keep, *children)
+
+    def no_visit_method(self, node, keep, *children):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    def visit_NumberNode(self, node, keep):
+        return node
+
+    def visit_VarAccessNode(self, node, keep):
+        return node
+
+    def visit_VarAssignNode(self, node, keep, value_node):
+        if value_node is node.value_node:
+            return node
+        return VarAssignNode(node.var_name_token, value_node)
+
+    def visit_StatementsNode(self, node, keep, *statement_nodes):
+        if all(new is old for new, old in zip(statement_nodes, node.statement_nodes)):
+            return node
+        return StatementsNode(list(statement_nodes))
+
+    def visit_BinaryOpNode(self, node, keep, left, right):
+        op_type = node.op_token.type
+
+        if isinstance(left, NumberNode) and isinstance(right, NumberNode):
+            value = self.fold(op_type, left.tok.value, right.tok.value)
+            if value is not None:
+                return self.number_node(value, node)
+
+        if op_type == T_MUL and self.is_literal(right, 1) and self.keeps(left, node, keep): return left  # x*1 = x
+        if op_type == T_MUL and self.is_literal(left, 1) and self.keeps(right, node, keep): return right  # 1*x = x
+        if op_type == T_MINUS and self.is_literal(right, 0) and self.keeps(left, node, keep): return left  # x-0 = x, but x+0 is not folded because -0.0 + 0 is 0.0
+        if op_type == T_POWER and self.is_literal(right, 1) and self.keeps(left, node, keep): return left  # x^1 = x
+
+        if left is node.left_node and right is node.right_node:
+            return node
+        return self.with_span(BinaryOpNode(left, node.op_token, right), node)
+
+    def visit_UnaryOpNode(self, node, keep, child):
+
+        if isinstance(child, NumberNode):
+            value = self.fold(node.op_token.type, child.tok.value)
+            if value is not None:
+                return self.number_node(value, node)
+
+        if node.op_token.type == T_PLUS and self.keeps(child, node, keep):  # +x = x
+            return child
+        if isinstance(child, UnaryOpNode) and child.op_token.type == T_MINUS and node.op_token.type == T_MINUS:  # --x = x
+            if not self.numbers.negation_overflows and self.keeps(child.node, node, keep):
+                return child.node
+
+        if child is node.node:
+            return node
+        return self.with_span(UnaryOpNode(node.op_token, child), node)
+
+    def keeps(self, child, node, keep):  # Checks that the value of the child would be seen at the same place as the value of the node it replaces
+        while isinstance(child, VarAssignNode):  # The value of an assignment has the position of its value node
+            child = child.value_node
+        pos_start, pos_end = child.pos_start, child.pos_end
+        keep_start, keep_end = keep
+        return (not keep_start or pos_start.index == node.pos_start.index) and (not keep_end or pos_end.index == node.pos_end.index)
+
+    def fold(self, op_type, left, right=None):  # Returns the value of a constant operation (a unary one without right), or None if it has to be left for the interpreter
+        if op_type == T_DIV and right == 0:  # The division by 0 error has to be raised at runtime with its traceback
+            return None
+        if op_type == T_POWER and isinstance(left, int) and isinstance(right, int) and right > 0:
+            if abs(left) > 1 and (abs(left).bit_length() - 1) * right > self.FOLD_POWER_MAX_BITS:
+                return None
+
+        numbers = self.numbers
+        try:
+            left = numbers.literal(left)
+            if right is None: value = numbers.negate(left) if op_type == T_MINUS else left  # A literal the backend can't represent is left to fail at runtime
+            else:
+                right = numbers.literal(right)
+                if op_type == T_PLUS: value = numbers.add(left, right)
+                elif op_type == T_MINUS: value = numbers.subtract(left, right)
+                elif op_type == T_MUL: value = numbers.multiply(left, right)
+                elif op_type == T_DIV: value = numbers.divide(left, right)
+                elif op_type == T_POWER: value = numbers.power(left, right)
+            if type(value) not in (int, float) or type(numbers.literal(value)) is not type(value):  # E.g. a complex number or a fraction, or a float the exact backend would read as a fraction
+                return None
+        except ArithmeticError:  # E.g. an overflow or 0 to a negative power, which the interpreter has to run into itself
+            return None
+        return value
+
+    def is_literal(self, node, value):  # Checks for an integer literal so identities like x*1 don't turn an int into a float
+        return isinstance(node, NumberNode) and type(node.tok.value) is int and node.tok.value == value
+
+    def number_node(self, value, node):  # Creates a number node for a folded value which spans the source of the subtree it replaces
+        token = Token(T_FLOAT if isinstance(value, float) else T_INT, value)
+        token.pos_start = node.pos_start
+        token.pos_end = node.pos_end
+        return NumberNode(token)
+
+    def with_span(self, new_node, node):  # A rebuilt node keeps the span of the original, even when its first or last child was simplified
+        new_node.pos_start = node.pos_start
+        new_node.pos_end = node.pos_end
+        return new_node
+
+
+# Interner class
+class Interner:
+    """
+    Hash conses a tree into a DAG: structurally identical subtrees, e.g. every copy of (a*b+c) in a generated formula, become one shared node.
+    The shared node is the first copy met in evaluation order (or a rebuilt node with that copy's position), so an error inside it points at
+    the first copy. Numbers and variable reads are left where they are, sharing them would save nothing and move the errors which point at
+    them. counts maps every operation node of the DAG to the number of places in the tree it stands for.
+    """
+    def intern(self, node):  # Works bottom up with an explicit stack like Optimizer, so a subtree is interned after its child nodes
+        self.nodes = {}  # Maps the key of each distinct subtree to its number and its shared node
+        self.ids = {}  # Maps each node of the DAG to the number of its subtree, which is the same for identical subtrees
+        self.counts = {}
+        results = []
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            children = node_children(node)
+            if children and not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+            else:
+                start = len(results) - len(children)
+                shared = results[start:]
+                del results[start:]
+                results.append(self.share(node, shared))
+        return results.pop()
+
+    def key(self, node, children):  # Equal for structurally identical subtrees
+        node_type = type(node)
+        ids = self.ids
+        if node_type is NumberNode:
+            value = node.tok.value
+            return (NumberNode, type(value), value, math.copysign(1, value) if type(value) is float else 1)  # Tells 1 from 1.0 and 0.0 from -0.0
+        if node_type is VarAccessNode: return (VarAccessNode, node.var_name_token.value)
+        if node_type is VarAssignNode: return (VarAssignNode, node.var_name_token.value, ids[children[0]])
+        if node_type is BinaryOpNode: return (BinaryOpNode, node.op_token.type, ids[children[0]], ids[children[1]])
+        if node_type is UnaryOpNode: return (UnaryOpNode, node.op_token.type, ids[children[0]])
+        return (node_type, *(ids[child] for child in children))
+
+    def share(self, node, children):  # Returns the node which stands for a subtree whose child nodes have been interned
+        key = self.key(node, children)
+        entry = self.nodes.get(key)
+        if entry is None:
+            entry = self.nodes[key] = [len(self.nodes), None]
+        if not children:
+            self.ids[node] = entry[0]
+            return node
+        shared = entry[1]
+        if shared is not None:
+            self.counts[shared] += 1
+            return shared
+        if any(new is not old for new, old in zip(children, node_children(node))):
+            node = self.rebuild(node, children)
+        entry[1] = node
+        self.ids[node] = entry[0]
+        self.counts[node] = 1
+        return node
+
+    def rebuild(self, node, children):  # A copy of the node on top of the shared child nodes, which keeps its own position and slot
+        node_type = type(node)
+        if node_type is BinaryOpNode:
+            new_node = BinaryOpNode(children[0], node.op_token, children[1])
+        elif node_type is UnaryOpNode:
+            new_node = UnaryOpNode(node.op_token, children[0])
+        elif node_type is VarAssignNode:
+            new_node = VarAssignNode(node.var_name_token, children[0])
+            new_node.slot = node.slot
+        else:
+            new_node = StatementsNode(list(children))
+        new_node.pos_start = node.pos_start
+        new_node.pos_end = node.pos_end
+        return new_node
+
+
+class Shared(Resolved):  # The form the sharing engine runs: the resolved DAG of a tree and the shared subtrees whose values a run keeps
+    __slots__ = ('memoized', 'dependents')
+
+    def __init__(self, body, names, used, memoized, dependents):
+        super().__init__(body, names, used)
+        self.memoized = memoized  # The subtrees used in more than one place which don't assign a variable
+        self.dependents = dependents  # Maps a slot to the memoized subtrees which read it, whose values an assignment to it throws away
+
+
+# Sharing interpreter class
+class SharingInterpreter(Interpreter):
+    """
+    Runs the DAG of a tree (see Interner), so a subtree which appears in many places is evaluated once per run. The value of a shared subtree
+    which doesn't assign anything is kept the first time it is worked out and reused wherever it appears again, until an assignment writes
+    one of the variables it reads. Values and tracebacks are those of Interpreter, except that an error in or pointing at a shared subtree
+    is reported at its first copy, as every copy is the same node.
+    """
+    def prepare(self, node, names=None):
+        interner = Interner()
+        dag = interner.intern(node)
+        if names is None:
+            names, used = Resolver().resolve(dag), None
+        else:  # The nodes were resolved with the whole program and rebuilt nodes keep their slots
+            used = Resolver().used(dag)
+
+        reads = {}  # Maps each node of the DAG to the slots its subtree reads, None if it assigns a variable
+        stack = [(dag, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in reads: continue
+            children = node_children(node)
+            if children and not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children if child not in reads)
+                continue
+            node_type = type(node)
+            if node_type is NumberNode:
+                reads[node] = frozenset()
+            elif node_type is VarAccessNode:
+                reads[node] = frozenset((node.slot,))
+            elif node_type is VarAssignNode:
+                reads[node] = None
+            else:
+                child_reads = [reads[child] for child in children]
+                reads[node] = None if any(slots is None for slots in child_reads) else frozenset().union(*child_reads)
+
+        memoized = set()
+        dependents = {}
+        for node, count in interner.counts.items():
+            if count > 1 and reads[node] is not None and type(node) is not StatementsNode:
+                memoized.add(node)
+                for slot in reads[node]:
+                    dependents.setdefault(slot, []).append(node)
+        return Shared(dag, names, used, memoized, dependents)
+
+    def execute(self, prepared, context):  # Walks the DAG in post order like Interpreter.execute, but doesn't go into a subtree whose value is kept
+        if type(prepared) is not Shared: prepared = self.prepare(prepared)
+        frame = prepared.frame(context.symbol_table)
+        memoized = prepared.memoized
+        dependents = prepared.dependents
+        memo = {}  # The value of each memoized subtree worked out so far in this run
+        values = []
+        budget = context.budget
+        step = budget.steps if budget else 0  # Every node evaluated or reused is a step
+        check_at = budget.next_check(step) if budget else math.inf
+        stack = [(prepared.body, False)]
+        try:
+            while stack:
+                node, expanded = stack.pop()
+                value = None
+                if not expanded:
+                    value = memo.get(node) if memo else None
+                    if value is None:
+                        children = node_children(node)
+                        if children:
+                            stack.append((node, True))
+                            stack.extend((child, False) for child in reversed(children))
+                            continue
+                step += 1
+                if step >= check_at:
+                    error = budget.check(step, node.pos_start, node.pos_end, context)
+                    if error: return RunTimeResult().failure(error)
+                    check_at = budget.next_check(step)
+                if value is not None:  # A copy, as the parent may move the value to its own position
+                    values.append(value.copy())
+                    continue
+                error = self.evaluate(node, values, frame, context)
+                if error: return RunTimeResult().failure(error)
+                if node in memoized:
+                    memo[node] = values[-1].copy()
+                elif memo and type(node) is VarAssignNode:
+                    for shared in dependents.get(node.slot, ()):
+                        memo.pop(shared, None)
+        finally:
+            if budget: budget.steps = step
+        return RunTimeResult().success(values.pop())
+
+
+# Opcode constants for the bytecode virtual machine
+OP_LOAD_CONST = 0  # Pushes a value from the constant pool
+OP_LOAD_VAR = 1  # Pushes the value of a variable from the symbol table
+OP_STORE_VAR = 2  # Stores the value on top of the stack into a variable (the value stays on the stack)
+OP_ADD = 3
+OP_SUBTRACT = 4
+OP_MULTIPLY = 5
+OP_DIVIDE = 6
+OP_POWER = 7
+OP_NEGATE = 8
+
+OPCODE_NAMES = ["LOAD_CONST", "LOAD_VAR", "STORE_VAR", "ADD", "SUBTRACT", "MULTIPLY", "DIVIDE", "POWER", "NEGATE"]  # Indexed by opcode, used when printing bytecode
+BINARY_OPCODES = {
+    T_PLUS: OP_ADD,
+    T_MINUS: OP_SUBTRACT,
+    T_MUL: OP_MULTIPLY,
+    T_DIV: OP_DIVIDE,
+    T_POWER: OP_POWER,
+}
+
+
+# Bytecode class
+class Bytecode:  # A flat, compiled form of an abstract syntax tree which can be run by the virtual machine
+    def __init__(self):
+        self.ops = array('B')  # The opcode of each instruction
+        self.args = array('I')  # The argument of each instruction (an index into the constant pool or the names list)
+        self.spans = []  # The (pos_start, pos_end) of the node each instruction came from, used for error messages
+        self.constants = []  # The constant pool holding the raw values of the number literals
+        self.names = []  # The variable names used by the program
+        self.operand_starts = {}  # Maps the index of each binary instruction to the start of its left operand, a numeric backend's error spans both operands
+        self.name_indices = {}  # Maps each variable name to its index in the names list
+        self.result_span = (None, None)  # The position of the node whose value is returned by the program
+
+    def emit(self, op, arg=0, span=(None, None)):
+        self.ops.append(op)
+        self.args.append(arg)
+        self.spans.append(span)
+
+    def add_constant(self, value):
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def add_name(self, name):
+        if name not in self.name_indices:
+            self.name_indices[name] = len(self.names)
+            self.names.append(name)
+        return self.name_indices[name]
+
+    def __repr__(self):
+        lines = []
+        for op, arg in zip(self.ops, self.args):
+            lines.append(f"{OPCODE_NAMES[op]} {arg}")
+        return "\n".join(lines)
+
+
+# Compiler class
+class Compiler:  # The compiler lowers the abstract syntax tree into bytecode, visiting the nodes in the same order as the interpreter
+    def compile(self, node):  # Every instruction comes after the instructions of its operands, so the nodes are compiled in post order
+        bytecode = Bytecode()
+        for child in postorder(node):
+            self.visit(child, bytecode)
+        bytecode.result_span = self.result_span(node)
+        return bytecode
+
+    def visit(self, node, bytecode):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        method(node, bytecode)
+
+    def no_visit_method(self, node, bytecode):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    def result_span(self, node):  # The interpreter returns the value of an assignment with the position of its value node
+        while isinstance(node, (VarAssignNode, StatementsNode)):
+            node = node.value_node if isinstance(node, VarAssignNode) else node.statement_nodes[-1]
+        return (node.pos_start, node.pos_end)
+
+    def operand_span(self, node, bytecode):  # The same as result_span for a node which was just compiled, without walking a chain of assignments again
+        if isinstance(node, VarAssignNode):  # Its STORE_VAR was the last instruction emitted and already holds the span
+            return bytecode.spans[-1]
+        return (node.pos_start, node.pos_end)
+
+    def visit_NumberNode(self, node, bytecode):
+        bytecode.emit(OP_LOAD_CONST, bytecode.add_constant(node.tok.value), (node.pos_start, node.pos_end))
+
+    def visit_VarAccessNode(self, node, bytecode):
+        bytecode.emit(OP_LOAD_VAR, bytecode.add_name(node.var_name_token.value), (node.pos_start, node.pos_end))
+
+    def visit_VarAssignNode(self, node, bytecode):
+        bytecode.emit(OP_STORE_VAR, bytecode.add_name(node.var_name_token.value), self.operand_span(node.value_node, bytecode))
 
-global_symbol_table = SymbolTable()
-global_symbol_table.set("NULL", Number(0))
+    def visit_BinaryOpNode(self, node, bytecode):
+        bytecode.operand_starts[len(bytecode.ops)] = self.result_span(node.left_node)[0]  # Only a chain of assignments is walked, and each chain is the operand of one node
+        bytecode.emit(BINARY_OPCODES[node.op_token.type], 0, self.operand_span(node.right_node, bytecode))  # A division by 0 error points at the value of the right hand node
+
+    def visit_UnaryOpNode(self, node, bytecode):
+        if node.op_token.type == T_MINUS:
+            bytecode.emit(OP_NEGATE, 0, self.operand_span(node.node, bytecode))
+
+    def visit_StatementsNode(self, node, bytecode):  # The values of the earlier statements are left under the last one, which is returned
+        pass
+
+
+# Virtual machine class
+class VirtualMachine:
+    """
+    Runs compiled bytecode on a value stack, only wrapping the values in Number objects at the boundaries. Like NativeInterpreter, the
+    few values whose context isn't the run's context, e.g. NULL's, are tracked by their index on the stack so the tracebacks match.
+    """
+    def visit(self, node, context):  # Same entry point as the interpreter so the two engines can be swapped
+        return self.execute(self.prepare(node), context)
+
+    def prepare(self, node, names=None):  # The bytecode has its own slots, the index of each name in its names list
+        return Compiler().compile(node)
+
+    def execute(self, bytecode, context):
+        result = RunTimeResult()
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        contexts = {}  # Maps the index on the stack of a value whose context isn't the run's context to its context
+        constants = bytecode.constants
+        names = bytecode.names
+        spans = bytecode.spans
+        symbol_table = context.symbol_table
+        frame = symbol_table.lookup(names)
+        numbers = context.numbers
+        literal = numbers.literal
+
+        budget = context.budget
+        first_step = budget.steps + 1 if budget else 1  # Every instruction executed is a step, index is the step less first_step
+        check_index = budget.next_check(first_step - 1) - first_step if budget else math.inf
+        index = -1
+
+        try:
+            for index, op in enumerate(bytecode.ops):
+                if index >= check_index:
+                    pos_start, pos_end = spans[index]
+                    error = budget.check(first_step + index, pos_start, pos_end, context)
+                    if error: return result.failure(error)
+                    check_index = budget.next_check(first_step + index) - first_step
+                try:
+                    if op == OP_LOAD_CONST:
+                        push(literal(constants[bytecode.args[index]]))
+                    elif op == OP_LOAD_VAR:
+                        value = frame[bytecode.args[index]]
+                        if value is None:
+                            pos_start, pos_end = spans[index]
+                            return result.failure(RunTimeError(pos_start, pos_end, f"'{names[bytecode.args[index]]}' is not defined!", context))
+                        if value.context is not context:
+                            contexts[len(stack)] = value.context
+                        push(value.value)
+                    elif op == OP_STORE_VAR:
+                        pos_start, pos_end = spans[index]
+                        value = frame[bytecode.args[index]] = Number(stack[-1]).set_context(contexts.get(len(stack) - 1, context)).set_position(pos_start, pos_end)
+                        symbol_table.set(names[bytecode.args[index]], value)
+                    elif op == OP_NEGATE:
+                        push(numbers.negate(pop()))
+                    else:
+                        right = pop()
+                        left = pop()
+                        if contexts: contexts.pop(len(stack) + 1, None)  # The result takes the place and the context of the left operand
+                        if op == OP_ADD:
+                            push(numbers.add(left, right))
+                        elif op == OP_SUBTRACT:
+                            push(numbers.subtract(left, right))
+                        elif op == OP_MULTIPLY:
+                            push(numbers.multiply(left, right))
+                        elif op == OP_DIVIDE:
+                            if right == 0:
+                                pos_start, pos_end = spans[index]
+                                return result.failure(RunTimeError(pos_start, pos_end, "Division by 0!", contexts.get(len(stack), context)))
+                            push(numbers.divide(left, right))
+                        elif op == OP_POWER:
+                            push(numbers.power(left, right))
+                except ArithmeticError as exception:  # Raised by the numeric backend, a binary instruction's error spans both of its operands
+                    pos_start, pos_end = spans[index]
+                    if index in bytecode.operand_starts: pos_start = bytecode.operand_starts[index]
+                    operand_context = context if op == OP_LOAD_CONST else contexts.get(len(stack), context)  # The operands were popped, the left one was at the top
+                    return result.failure(number_error(exception, pos_start, pos_end, operand_context))
+        finally:
+            if budget: budget.steps = first_step + index
+
+        pos_start, pos_end = bytecode.result_span
+        value = pop()
+        return result.success(Number(value).set_context(contexts.get(len(stack), context)).set_position(pos_start, pos_end))
+
+
+# JIT compiler class
+class JitFallback(Exception):  # Raised by compiled code for anything it doesn't report itself, the run is then done again by the native engine
+    pass
+
+
+class JitCompiler:
+    """
+    Turns a resolved tree into the source of one Python function with a statement per node, which Python compiles into a code object once.
+    The values live in local variables named after their depth on the evaluation stack (s0, s1, ...), the Numbers whose context a value
+    carries in o0, o1, ..., and the stored variables in the frame. Everything about a Number which can be seen (its context, its position
+    and which Number a variable holds) is worked out while compiling, the same way NativeInterpreter works it out while running.
+    """
+    def compile(self, node):  # Returns the source of a function make(numbers, literals, spans, Number) which returns the compiled run function
+        self.lines = []
+        self.spans = []  # The positions the code refers to, as a list so the source doesn't need to spell them out
+        self.constants = []  # The values of the number literals, converted with the numeric backend once per backend
+        self.assigned = []  # The slots the code assigns, written back to the symbol table once the run has succeeded
+        self.origins = []  # For each depth of the stack, whether the context of its value comes from a variable's Number (True) or is the run's context
+        self.passed_on = set()  # The unary '+' nodes whose value is the Number stored by the assignment under them, see NativeInterpreter
+        self.steps = 0
+
+        for child in postorder(node):
+            self.steps += 1
+            if self.steps % RunBudget.CHECK_INTERVAL == 0:  # A long run checks its deadline every so many nodes, like the other engines
+                self.emit("if deadline is not None and perf_counter() > deadline: raise JitFallback()")
+            self.visit(child)
+
+        depth = len(self.origins) - 1
+        self.emit(f"return Number(s{depth}).set_context({self.context(depth)}).set_position(*SPANS[{self.span(self.result_span(node))}])")
+        body = "\n".join("        " + line for line in self.lines)
+        return ("def make(numbers, C, SPANS, Number, JitFallback, perf_counter):\n"
+                "    add, subtract, multiply, divide, power, negate = numbers.add, numbers.subtract, numbers.multiply, numbers.divide, numbers.power, numbers.negate\n"
+                "    def run(F, context, deadline):\n"
+                f"{body}\n"
+                "    return run\n")
+
+    def emit(self, line):
+        self.lines.append(line)
+
+    def result_span(self, node):  # The position of the value of a node, an assignment has the position of its value node
+        while isinstance(node, (VarAssignNode, StatementsNode)):
+            node = node.value_node if isinstance(node, VarAssignNode) else node.statement_nodes[-1]
+        return node.pos_start, node.pos_end
+
+    def span(self, span):  # The index of a (pos_start, pos_end) pair in the spans list
+        self.spans.append(span)
+        return len(self.spans) - 1
+
+    def context(self, depth):  # The expression for the context of the value at the depth
+        return f"o{depth}.context" if self.origins[depth] else "context"
+
+    def visit(self, node):
+        node_type = type(node)
+        depth = len(self.origins)
+        if node_type is NumberNode:
+            self.constants.append(node.tok.value)
+            self.emit(f"s{depth} = C[{len(self.constants) - 1}]")
+            self.origins.append(False)
+        elif node_type is VarAccessNode:
+            self.emit(f"o{depth} = F[{node.slot}]")
+            self.emit(f"if o{depth} is None: raise JitFallback()")  # Not defined, the native engine reports it
+            self.emit(f"s{depth} = o{depth}.value")
+            self.origins.append(True)
+        elif node_type is VarAssignNode:
+            value_node = node.value_node
+            if type(value_node) is not VarAssignNode and value_node not in self.passed_on:
+                self.emit(f"st = Number(s{depth - 1}).set_context({self.context(depth - 1)}).set_position(*SPANS[{self.span((value_node.pos_start, value_node.pos_end))}])")
+            self.emit(f"F[{node.slot}] = st")
+            if node.slot not in self.assigned: self.assigned.append(node.slot)
+        elif node_type is BinaryOpNode:
+            op_type = node.op_token.type
+            left, right = depth - 2, depth - 1
+            if op_type == T_DIV:
+                self.emit(f"if s{right} == 0: raise JitFallback()")
+            function = {T_PLUS: "add", T_MINUS: "subtract", T_MUL: "multiply", T_DIV: "divide", T_POWER: "power"}[op_type]
+            self.emit(f"s{left} = {function}(s{left}, s{right})")
+            self.origins.pop()
+        elif node_type is UnaryOpNode:
+            if node.op_token.type == T_MINUS:
+                self.emit(f"s{depth - 1} = negate(s{depth - 1})")
+            elif type(node.node) is VarAssignNode or node.node in self.passed_on:  # Like Interpreter, +(VAR a = 1) moves the Number stored in a to the position of the '+'
+                self.emit(f"st.set_position(*SPANS[{self.span((node.pos_start, node.pos_end))}])")
+                self.passed_on.add(node)
+        elif node_type is StatementsNode:  # The value of the last statement takes the place of the first one
+            first, last = depth - len(node.statement_nodes), depth - 1
+            if first != last:
+                self.emit(f"s{first} = s{last}")
+                if self.origins[last]: self.emit(f"o{first} = o{last}")
+                self.origins[first] = self.origins[last]
+                del self.origins[first + 1:]
+        else:
+            raise Exception(f"No visit_{node_type.__name__} method defined")
+
+
+class Jitted(Resolved):  # The form the JIT engine runs: a resolved tree, its native form and, once it is hot, its compiled code
+    __slots__ = ('native', 'runs', 'make', 'spans', 'constants', 'assigned', 'steps', 'functions')
+
+    def __init__(self, body, names, used, native):
+        super().__init__(body, names, used)
+        self.native = native  # What runs before the code is compiled, and what a run which gives up is done again with
+        self.runs = 0
+        self.make = None  # Makes the run function for a numeric backend, set once the code is compiled
+        self.functions = {}  # The run function for each numeric backend key
+
+    def compile(self):
+        compiler = JitCompiler()
+        namespace = {}
+        exec(compile(compiler.compile(self.body), "<jit>", "exec"), namespace)
+        self.spans = compiler.spans
+        self.constants = compiler.constants
+        self.assigned = compiler.assigned
+        self.steps = compiler.steps
+        self.make = namespace["make"]
+
+    def function(self, numbers):  # The run function for the backend, None if one of the literals can't be represented by it
+        key = numbers.key
+        function = self.functions.get(key, False)
+        if function is False:
+            try:
+                literals = [numbers.literal(value) for value in self.constants]
+            except ArithmeticError:  # The native engine reports the literal
+                literals = None
+            function = self.functions[key] = self.make(numbers, literals, self.spans, Number, JitFallback, perf_counter) if literals is not None else None
+        return function
+
+
+# JIT interpreter class
+class JitInterpreter:
+    """
+    Runs hot programs as Python functions generated from their trees, so a node costs one line of compiled Python instead of a trip through
+    an interpreter loop. A program is run by NativeInterpreter until its HOT_RUNS run, when it is compiled, so programs which only run once
+    don't pay for compiling, and trees bigger than MAX_NODES are never compiled. Only the common path is compiled: a division by 0, an
+    undefined variable, an error from the numeric backend or a broken limit makes the compiled code give up, and the run is done again from
+    the start by NativeInterpreter, which reports the error with the same positions and traceback as Interpreter. Assignments are only
+    written to the symbol table once a compiled run has succeeded, so the run which is done again sees the variables as they were.
+    """
+    HOT_RUNS = 2
+    MAX_NODES = 100_000
+
+    def prepare(self, node, names=None):
+        native = NativeInterpreter().prepare(node, names)
+        return Jitted(node, native.names, native.used, native)
+
+    def execute(self, prepared, context):
+        if prepared.make is None:
+            prepared.runs += 1
+            if prepared.runs < self.HOT_RUNS or len(prepared.native.body) > self.MAX_NODES:
+                return NativeInterpreter().execute(prepared.native, context)
+            prepared.compile()
+
+        budget = context.budget
+        function = prepared.function(context.numbers)
+        if function is None or (budget is not None and budget.limits.max_steps is not None and budget.steps + prepared.steps > budget.limits.max_steps):
+            return NativeInterpreter().execute(prepared.native, context)  # Reports the literal or stops at the step over the limit
+
+        symbol_table = context.symbol_table
+        frame = prepared.frame(symbol_table)
+        try:
+            value = function(frame, context, budget.deadline if budget is not None else None)
+        except (JitFallback, ArithmeticError):
+            return NativeInterpreter().execute(prepared.native, context)
+
+        names = prepared.names
+        for slot in prepared.assigned:
+            symbol_table.set(names[slot], frame[slot])
+        if budget is not None: budget.steps += prepared.steps
+        return RunTimeResult().success(value)
+
+
+# Profiler class
+class Profiler:
+    """
+    Opt in instrumentation of runs: the wall time of each phase, the number of visits and the time spent in each node type, the number of
+    Number and RunTimeResult objects created and the hottest spans of source. Pass one to run() or Session.run(), a run without a profiler
+    doesn't pay for any of this. Allocations are counted by wrapping the constructors while any profiled program runs, the wrappers are put
+    in by the first run and taken out by the last one to finish, and each object is only counted by the profilers of the thread creating it.
+    """
+    COUNTED_CLASSES = ("Number", "RunTimeResult")
+    counting_lock = Lock()  # Guards the wrapping of the constructors, which is shared by the profilers of every thread
+    counting_runs = 0  # The number of counting_allocations blocks running in any thread, the constructors are wrapped while it is above 0
+    original_inits = {}  # Maps each counted class to its constructor while it is wrapped
+    counting = local()  # The profilers counting allocations on each thread, in counting.profilers
+
+    def __init__(self):
+        self.phase_times = {}  # Maps a phase (lex, parse, optimize, prepare, execute) to the seconds spent in it
+        self.visit_counts = {}  # Maps a node type to its number of visits
+        self.visit_times = {}  # Maps a node type to the seconds spent in its visit method, excluding the time spent in its child nodes
+        self.allocations = {name: 0 for name in self.COUNTED_CLASSES}
+        self.spans = {}  # Maps a span of source (source, index_start, index_end) to its [visit count, seconds], excluding child nodes
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + perf_counter() - start
+
+    @contextmanager
+    def counting_allocations(self):  # Counts the objects of the counted classes this thread creates until the block exits
+        profilers = getattr(Profiler.counting, "profilers", None)
+        if profilers is None:
+            profilers = Profiler.counting.profilers = []
+        with Profiler.counting_lock:
+            if Profiler.counting_runs == 0:
+                for name in self.COUNTED_CLASSES:
+                    cls = globals()[name]
+                    Profiler.original_inits[cls] = cls.__init__
+                    cls.__init__ = Profiler.counted_init(name, cls.__init__)
+            Profiler.counting_runs += 1
+        profilers.append(self)
+        try:
+            yield
+        finally:
+            profilers.remove(self)
+            with Profiler.counting_lock:
+                Profiler.counting_runs -= 1
+                if Profiler.counting_runs == 0:
+                    for cls, init in Profiler.original_inits.items():
+                        cls.__init__ = init
+                    Profiler.original_inits.clear()
+
+    @staticmethod
+    def counted_init(name, init):
+        counting = Profiler.counting
+        def counted(obj, *args, **kwargs):
+            for profiler in getattr(counting, "profilers", ()):
+                profiler.allocations[name] += 1
+            init(obj, *args, **kwargs)
+        return counted
+
+    def record_visit(self, node, seconds):
+        node_type = type(node).__name__
+        self.visit_counts[node_type] = self.visit_counts.get(node_type, 0) + 1
+        self.visit_times[node_type] = self.visit_times.get(node_type, 0.0) + seconds
+
+        key = (node.pos_start.source, node.pos_start.index, node.pos_end.index)
+        span = self.spans.get(key)
+        if span is None:
+            self.spans[key] = [1, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+
+    def hot_spans(self, limit=10):  # The spans of source with the most time spent in them, described by their line, column and text
+        hottest = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        spans = []
+        for (source, index_start, index_end), (count, seconds) in hottest:
+            line_num, col_num = source.line_and_column(index_start)
+            text = source.text[index_start:index_end]
+            spans.append({
+                "file": source.file_name,
+                "line": line_num + 1,
+                "column": col_num + 1,
+                "text": text if len(text) <= 40 else text[:37] + "...",
+                "count": count,
+                "seconds": seconds,
+            })
+        return spans
+
+    def report(self, limit=10):  # The profile as a dictionary which can be dumped as JSON
+        return {
+            "phases": dict(self.phase_times),
+            "nodes": {node_type: {"count": count, "seconds": self.visit_times[node_type]} for node_type, count in self.visit_counts.items()},
+            "allocations": dict(self.allocations),
+            "hot_spans": self.hot_spans(limit),
+        }
+
+    def summary(self, limit=10):  # The profile as readable text, e.g. for the shell
+        lines = ["Phases:"]
+        for name, seconds in self.phase_times.items():
+            lines.append(f"  {name:<10} {seconds * 1000:10.3f} ms")
+        if self.visit_counts:
+            lines.append("Nodes:")
+            for node_type, count in sorted(self.visit_counts.items(), key=lambda item: self.visit_times[item[0]], reverse=True):
+                lines.append(f"  {node_type:<15} {count:8} visits {self.visit_times[node_type] * 1000:10.3f} ms")
+        lines.append("Allocations:")
+        for name, count in self.allocations.items():
+            lines.append(f"  {name:<15} {count:8}")
+        hot_spans = self.hot_spans(limit)
+        if hot_spans:
+            lines.append("Hottest spans:")
+            for span in hot_spans:
+                lines.append(f"  {span['file']}:{span['line']}:{span['column']} {span['seconds'] * 1000:10.3f} ms {span['count']:8} visits  {span['text']}")
+        return "\n".join(lines)
+
+
+# Profiling interpreter class
+class ProfilingInterpreter(Interpreter):  # The tree walking interpreter, timing every visit for a profiler
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def evaluate(self, node, values, frame, context):  # The child nodes were evaluated before, so this is the time spent in the node itself
+        start = perf_counter()
+        error = Interpreter.evaluate(self, node, values, frame, context)
+        self.profiler.record_visit(node, perf_counter() - start)
+        return error
+
+
+# Program class
+class Program:  # A lexed and parsed program which can be run many times, it keeps the form each engine runs so that is only made once
+    def __init__(self, file_name, text, node=None, error=None, token_count=None):
+        self.file_name = file_name
+        self.text = text
+        self.node = node
+        self.error = error  # The illegal character or syntax error, if the program failed to lex or parse
+        self.token_count = token_count  # The number of tokens the text was lexed into, not counting the EOF token
+        self.prepared = {}  # Maps an engine name to the prepared form of the program (e.g. bytecode for the virtual machine)
+        self.prepared_statements = {}  # Maps an engine name to the prepared form of each statement, for running them one at a time
+
+    @property
+    def statements(self):
+        return self.node.statement_nodes if isinstance(self.node, StatementsNode) else [self.node]
+
+    def prepare(self, engine):
+        prepared = self.prepared.get(engine)
+        if prepared is None:
+            prepared = self.prepared[engine] = ENGINES[engine]().prepare(self.node)
+        return prepared
+
+    def prepare_statements(self, engine):
+        prepared = self.prepared_statements.get(engine)
+        if prepared is None:
+            interpreter = ENGINES[engine]()
+            names = Resolver().resolve(self.node)  # The statements share the slots of the whole program, see Resolver
+            prepared = self.prepared_statements[engine] = [interpreter.prepare(node, names) for node in self.statements]
+        return prepared
+
+
+def compile_program(file_name, text, optimize=False, profiler=None, numbers=None):  # Lexes and parses the text into a program without running it
+    if profiler is not None:
+        return profile_compile(file_name, text, optimize, profiler, numbers)
 
-def run(file_name, text):  # This is going to get the input text and return a list of token objects and an error if needed
     lexer = Lexer(file_name, text)
     tokens, error = lexer.make_tokens()
-    if error: return None, error
+    if error: return Program(file_name, text, error=error)
 
     # Generate the abstract syntax tree (AST)
     parser = Parser(tokens)
     ast = parser.parse()
-    if ast.error: return None, ast.error  # Returns out if an error is found during parsing
+    if ast.error: return Program(file_name, text, error=ast.error)  # Returns out if an error is found during parsing
+
+    if optimize:  # Constant folding and algebraic simplification before running, with the numeric backend the program is run with
+        ast.node = Optimizer(numbers).optimize(ast.node)
+    return Program(file_name, text, ast.node, token_count=len(tokens) - 1)
+
+
+def profile_compile(file_name, text, optimize, profiler, numbers=None):  # The same steps as compile_program, timing each phase
+    with profiler.phase("lex"):
+        tokens, error = Lexer(file_name, text).make_tokens()
+    if error: return Program(file_name, text, error=error)
+
+    with profiler.phase("parse"):
+        ast = Parser(tokens).parse()
+    if ast.error: return Program(file_name, text, error=ast.error)
+
+    if optimize:
+        with profiler.phase("optimize"):
+            ast.node = Optimizer(numbers).optimize(ast.node)
+    return Program(file_name, text, ast.node, token_count=len(tokens) - 1)
+
 
-    # Running the program by creating an interpreter instance
-    interpreter = Interpreter()
-    context = Context("<program>")  # Root context of the whole program
-    context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, context)
+DIAGNOSTIC_WIDTH = 160  # The most characters of a source line format_errors shows, the rest of a long line is cut off
 
-    return result.value, result.error
+def check_program(file_name, text):
+    """
+    Lexes and parses the text without running it and returns all of its illegal characters and syntax errors in the order they appear,
+    where compile_program stops at the first one. Illegal characters are skipped and parsing carries on at the next statement after a
+    syntax error, so a file is checked in one pass however many errors it has.
+    """
+    errors = []
+    tokens, _ = Lexer(file_name, text).make_tokens(errors)
+    illegal = [error.pos_start.index for error in errors]  # In order, as the lexer goes through the text from the start
+    parser = Parser(tokens)
+    syntax_errors = []
+    for statement in parser.statements(recover=True):
+        if not statement.error: continue
+        start = tokens.ends[parser.statement_idx - 1] if parser.statement_idx > 0 else 0  # The end of the separator before the statement
+        index = bisect_left(illegal, start)
+        if index < len(illegal) and illegal[index] <= statement.error.pos_start.index:  # The skipped character is the likely cause, so this isn't reported again
+            continue
+        syntax_errors.append(statement.error)
+    errors.extend(syntax_errors)
+    errors.sort(key=lambda error: error.pos_start.index)  # Two runs which are in order already, which sort merges in linear time
+    return errors
+
+def format_errors(errors, width=DIAGNOSTIC_WIDTH):  # The messages of many errors of one source, its line start index is only built once
+    return "\n\n".join(error.message(width) for error in errors)
+
+
+# Program cache class
+class ProgramCache:  # A thread safe, least recently used cache of compiled programs keyed by the file name and source text
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.programs = OrderedDict()  # Ordered from the least to the most recently used
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_name, text, optimize=False, disk_cache=None, numbers=None):  # Returns the cached program for the text, compiling (or loading it from the disk cache) and caching it if needed
+        key = (file_name, text, optimize, (numbers or default_numbers).key if optimize else None)  # Folded constants depend on the numeric backend
+        with self.lock:
+            program = self.programs.get(key)
+            if program is not None:
+                self.programs.move_to_end(key)
+                self.hits += 1
+                return program
+            self.misses += 1
+
+        # Compiled outside the lock so other threads aren't held up by a big program
+        program = disk_cache.get(file_name, text, optimize, numbers) if disk_cache is not None else compile_program(file_name, text, optimize, numbers=numbers)
+
+        with self.lock:
+            if key in self.programs:  # Another thread compiled the same program in the meantime
+                return self.programs[key]
+            self.programs[key] = program
+            while len(self.programs) > self.max_size:
+                self.programs.popitem(last=False)
+                self.evictions += 1
+        return program
+
+    def clear(self):
+        with self.lock:
+            self.programs.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.programs), "max_size": self.max_size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# Disk cache class
+DISK_CACHE_VERSION = 2  # Bumped whenever the encoding changes, entries written with another version are compiled again and overwritten
+NODE_KINDS = [NumberNode, VarAccessNode, VarAssignNode, BinaryOpNode, UnaryOpNode, StatementsNode]  # Indexed by the kind stored for each node
+NODE_KIND_CODES = {node_type: code for code, node_type in enumerate(NODE_KINDS)}
+
+class DiskCache:
+    """
+    Keeps the syntax trees of compiled programs in a directory so a later process can load them instead of lexing and parsing again.
+    Each file name (and optimize flag) gets one entry holding a hash of the source text, so an entry for an edited file is stale: it is
+    compiled again and overwritten. An entry is the tree flattened in evaluation order into arrays of node kinds and source spans plus a
+    list of token values and the program's token count, serialized with marshal and read back through a memory map. Entries are written to a temporary file which is
+    then renamed, so processes sharing a directory never see half written entries. Programs which fail to compile aren't stored.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # Misses on an entry for the same file with different source text, or written by another version
+
+    def path(self, file_name, optimize, numbers=None):  # An optimized program also depends on the numeric backend its constants were folded with
+        fold_key = (numbers or default_numbers).key if optimize else None
+        key = hashlib.sha256(f"{file_name}\0{bool(optimize)}\0{fold_key}".encode("utf-8", "surrogatepass")).hexdigest()
+        return os.path.join(self.directory, key[:32] + ".basc")
+
+    def source_hash(self, text):
+        return hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()
+
+    def get(self, file_name, text, optimize=False, numbers=None):  # Returns the program for the text, loading it from the directory or compiling and storing it
+        path = self.path(file_name, optimize, numbers)
+        source_hash = self.source_hash(text)
+        loaded = self.load(path, file_name, text, source_hash)
+        if loaded is not None:
+            self.hits += 1
+            node, token_count = loaded
+            return Program(file_name, text, node, token_count=token_count)
+
+        self.misses += 1
+        program = compile_program(file_name, text, optimize, numbers=numbers)
+        if not program.error:
+            self.store(path, program.node, source_hash, program.token_count)
+        return program
+
+    def load(self, path, file_name, text, source_hash):  # Returns the stored tree and token count, or None if there is no usable entry
+        try:
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                entry = marshal.loads(data)
+        except (OSError, ValueError, EOFError, TypeError):  # No entry, an empty file or one marshal can't read
+            return None
+
+        if not isinstance(entry, tuple) or len(entry) != 6 or entry[:3] != ("BASIC", DISK_CACHE_VERSION, sys.byteorder) or entry[3] != source_hash:
+            self.stale += 1
+            return None
+        try:
+            return self.decode(entry[4], Source(file_name, text)), entry[5]
+        except (ValueError, IndexError, TypeError, KeyError, StopIteration):  # A corrupt entry is compiled again like a stale one
+            self.stale += 1
+            return None
+
+    def store(self, path, node, source_hash, token_count=None):
+        data = marshal.dumps(("BASIC", DISK_CACHE_VERSION, sys.byteorder, source_hash, self.encode(node), token_count))
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:  # The cache is only an optimization, a directory which can't be written to just means compiling every time
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def encode(self, node):
+        """
+        Flattens the tree in post order into the kind and token value of each node and the span of each token. A node's own span is only
+        stored (in overrides) when it isn't the one its constructor works out from its token and child nodes, e.g. for a folded number.
+        """
+        kinds = array('B')
+        values = []
+        token_spans = []
+        overrides = []  # Flat (node index, start, end) triples
+        for index, node in enumerate(postorder(node)):
+            node_type = type(node)
+            kinds.append(NODE_KIND_CODES[node_type])
+            if node_type is StatementsNode:
+                values.append(len(node.statement_nodes))
+                start, end = node.statement_nodes[0].pos_start, node.statement_nodes[-1].pos_end
+            else:
+                if node_type is NumberNode:
+                    token = node.tok
+                    start, end = token.pos_start, token.pos_end
+                elif node_type is VarAccessNode:
+                    token = node.var_name_token
+                    start, end = token.pos_start, token.pos_end
+                elif node_type is VarAssignNode:
+                    token = node.var_name_token
+                    start, end = token.pos_start, node.value_node.pos_end
+                elif node_type is UnaryOpNode:
+                    token = node.op_token
+                    start, end = token.pos_start, node.node.pos_end
+                else:
+                    token = node.op_token
+                    start, end = node.left_node.pos_start, node.right_node.pos_end
+                values.append(token.type if node_type is BinaryOpNode or node_type is UnaryOpNode else token.value)
+                token_spans.append(token.pos_start.index)
+                token_spans.append(token.pos_end.index)
+            if node.pos_start.index != start.index or node.pos_end.index != end.index:
+                overrides.extend((index, node.pos_start.index, node.pos_end.index))
+
+        typecode = 'I' if max(token_spans + overrides, default=0) < 1 << 32 else 'Q'  # Four bytes per index unless the source is huge
+        return kinds.tobytes(), typecode, array(typecode, token_spans).tobytes(), array(typecode, overrides).tobytes(), values
+
+    def decode(self, encoded, source):  # Rebuilds the tree, the nodes are made in post order so their child nodes are on top of the stack
+        kinds, typecode, token_spans, overrides, values = encoded
+        kinds = array('B', kinds)
+        token_spans = array(typecode, token_spans)
+        overrides = array(typecode, overrides)
+        if len(values) != len(kinds):
+            raise ValueError("Mismatched arrays")
+        overrides = {overrides[index]: (overrides[index + 1], overrides[index + 2]) for index in range(0, len(overrides), 3)}
+
+        enabled = gc.isenabled()
+        gc.disable()  # The tree has no cycles, but allocating a node per token otherwise sets off collections which scan every node again
+        try:
+            return self.build(kinds, values, iter(token_spans), overrides, source)
+        finally:
+            if enabled: gc.enable()
+
+    def build(self, kinds, values, spans, overrides, source):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for index, (kind, value) in enumerate(zip(kinds, values)):
+            if kind == 5:  # StatementsNode, the codes follow NODE_KINDS
+                node = StatementsNode(stack[len(stack) - value:])
+                del stack[len(stack) - value:]
+            else:
+                if kind == 0:
+                    token = Token(T_FLOAT if type(value) is float else T_INT, value)
+                elif kind <= 2:
+                    token = Token(T_IDENTIFIER, value)
+                else:
+                    token = Token(value)
+                token.pos_start = Position(next(spans), source)
+                token.pos_end = Position(next(spans), source)
+
+                if kind == 0: node = NumberNode(token)
+                elif kind == 1: node = VarAccessNode(token)
+                elif kind == 2: node = VarAssignNode(token, pop())
+                elif kind == 4: node = UnaryOpNode(token, pop())
+                else:
+                    right = pop()
+                    node = BinaryOpNode(pop(), token, right)
+
+            if index in overrides:  # E.g. a node the optimizer rebuilt keeps the span of the original
+                node_start, node_end = overrides[index]
+                node.pos_start = Position(node_start, source)
+                node.pos_end = Position(node_end, source)
+            push(node)
+
+        if len(stack) != 1:
+            raise ValueError("Malformed tree")
+        return stack[0]
+
+
+# Dependency graph class
+class CycleError(RunTimeError):  # An assignment which would make a variable of a reactive session depend on itself, see DependencyGraph
+    def __init__(self, pos_start, pos_end, details, context):
+        super().__init__(pos_start, pos_end, details, context)
+        self.error_name = "Dependency cycle"
+
+
+class Binding:  # How a variable of a reactive session was last assigned: the expression its value is worked out from and the variables it reads
+    __slots__ = ('name', 'node', 'names', 'reads', 'size', 'self_write', 'nested', 'prepared')
+
+    def __init__(self, node, names, reads, size, self_write=None):
+        self.name = node.var_name_token.value
+        self.node = node  # The VarAssignNode, its value node is run again to recompute the variable
+        self.names = names  # The slots of the program the node is part of, see Resolver
+        self.reads = reads  # The variables the value reads before assigning them itself, in the order they are first read
+        self.size = size  # The number of nodes of the value
+        self.self_write = self_write  # A variable the value reads and then assigns, which makes the binding a cycle of its own
+        self.nested = None  # The assignments inside the value, only found once the value is recomputed
+        self.prepared = {}  # Maps an engine name to the prepared form of the value
+
+    @property
+    def writes(self):  # The assignments inside the value, e.g. to b in VAR a = (VAR b = 2) * 3
+        if self.nested is None:
+            self.nested = tuple(child for child in postorder(self.node.value_node) if type(child) is VarAssignNode)
+        return self.nested
+
+
+class DependencyGraph:
+    """
+    Keeps the variables of a reactive session up to date. Every assignment a run makes binds its variable to the expression it was assigned,
+    and records the variables the expression reads. When a variable is assigned again, only the bindings which read it (directly or through
+    other bindings) are recomputed, each once and after the bindings it reads. An assignment which would make a variable depend on itself,
+    e.g. VAR a = b + 1 while b is bound to a * 2, or VAR n = n + 1, is a cycle and is reported before the program runs.
+    """
+    def __init__(self):
+        self.bindings = {}  # Maps a variable to its Binding, variables without one are inputs
+        self.dependents = {}  # Maps a variable to the names of the bindings which read it
+        self.total_size = 0  # The nodes of every binding, which is what running all of them again costs
+        self.invalid = set()  # The variables whose binding failed to recompute, or reads one which did, so they hold an out of date value
+
+        # Counters for stats()
+        self.updates = 0
+        self.recomputed = 0
+        self.recomputed_nodes = 0
+        self.full_rerun_nodes = 0
+        self.cycles = 0
+        self.last_recomputed = 0
+        self.last_recomputed_nodes = 0
+
+    def copy(self):  # For a forked session, which recomputes its own copies of the variables
+        graph = copy.copy(self)
+        graph.bindings = dict(self.bindings)
+        graph.dependents = {name: set(names) for name, names in self.dependents.items()}
+        graph.invalid = set(self.invalid)
+        return graph
+
+    def assignments(self, program):  # The Binding each assignment of the program would make, the last one wins, ordered by when their variables were last assigned
+        names = Resolver().resolve(program.node)  # The slots every engine gives the program, so the values can be prepared as part of it
+        assignments = {}
+        # The reads, writes and size of each subtree whose parent hasn't been reached yet, worked out in one pass from the bottom up. reads
+        # and written map a variable to the index in postorder at which the subtree first reads or assigns it, so the order of the reads is
+        # kept when two subtrees are merged by adding the smaller one to the bigger one
+        subtrees = []
+        for index, node in enumerate(postorder(program.node)):
+            node_type = type(node)
+            count = len(node_children(node))
+            if count == 0:
+                reads, written, size = {}, {}, 0
+            else:
+                reads, written, size = subtrees[-count]
+                for right_reads, right_written, right_size in subtrees[len(subtrees) - count + 1:]:
+                    size += right_size
+                    if len(right_reads) + len(right_written) > len(reads) + len(written):
+                        for name in written:  # A variable read after the left subtree assigned it doesn't depend on anything outside the value
+                            right_reads.pop(name, None)
+                        right_reads.update(reads)  # The left subtree comes first, so its indices win
+                        right_written.update(written)
+                        reads, written = right_reads, right_written
+                    else:
+                        for name, read_at in right_reads.items():
+                            if name not in written and name not in reads: reads[name] = read_at
+                        for name, written_at in right_written.items():
+                            if name not in written: written[name] = written_at
+                del subtrees[len(subtrees) - count:]
+
+            if node_type is VarAccessNode:
+                name = node.var_name_token.value
+                if name not in written and name not in reads: reads[name] = index
+            elif node_type is VarAssignNode:  # reads and written are the value's
+                smaller, bigger = (reads, written) if len(reads) < len(written) else (written, reads)
+                read_and_written = [name for name in smaller if name in bigger]
+                self_write = min(read_and_written, key=written.get) if read_and_written else None  # The first variable it reads and then assigns
+                binding = Binding(node, names, tuple(sorted(reads, key=reads.get)), size, self_write)
+                assignments.pop(binding.name, None)
+                assignments[binding.name] = binding
+                if binding.name not in written: written[binding.name] = index
+            subtrees.append((reads, written, size + 1))
+        return assignments
+
+    def check(self, assignments, context):  # The CycleError for the first cycle the assignments would make, None if there is none
+        def reads(name):
+            binding = assignments.get(name) or self.bindings.get(name)
+            return binding.reads if binding is not None else ()
+
+        for binding in assignments.values():  # A value which assigns a variable it read, e.g. VAR a = b + (VAR b = 1), would make itself stale
+            if binding.self_write is not None:
+                self.cycles += 1
+                return CycleError(binding.node.pos_start, binding.node.pos_end, f"{binding.name} -> {binding.self_write} -> {binding.name}", context)
+
+        state = {}  # Maps a variable to 1 while the search is below it and to 2 once everything it reads has been searched
+        for root in assignments:  # The graph has no cycle yet, so any new one goes through an assigned variable
+            if root in state: continue
+            path = [root]
+            pending = [iter(reads(root))]
+            state[root] = 1
+            while path:
+                for name in pending[-1]:
+                    if state.get(name) == 1:
+                        cycle = path[path.index(name):] + [name]
+                        node = assignments[cycle[0]].node if cycle[0] in assignments else assignments[root].node
+                        self.cycles += 1
+                        return CycleError(node.pos_start, node.pos_end, " -> ".join(cycle), context)
+                    if name not in state:
+                        state[name] = 1
+                        path.append(name)
+                        pending.append(iter(reads(name)))
+                        break
+                else:
+                    state[path.pop()] = 2
+                    pending.pop()
+        return None
+
+    def bind(self, binding):  # The binding has just been run, so its variable holds its value
+        self.unbind(binding.name)
+        self.bindings[binding.name] = binding
+        self.total_size += binding.size
+        for name in binding.reads:
+            self.dependents.setdefault(name, set()).add(binding.name)
+
+    def unbind(self, name):  # Makes the variable an input again, e.g. when it is set from Python
+        self.invalid.discard(name)
+        binding = self.bindings.pop(name, None)
+        if binding is None: return
+        self.total_size -= binding.size
+        for read in binding.reads:
+            self.dependents[read].discard(name)
+
+    def stale(self, changed, failed=()):
+        """
+        Yields the bindings to recompute after the variables in changed were assigned, in the order they have to be recomputed in. changed
+        is in the order the variables were last assigned, a binding which was assigned itself is only stale if something it reads was
+        assigned after it. Every binding yielded is counted as recomputed. The caller adds the name of a binding which fails to the failed
+        set, the bindings which read it (directly or through other bindings) are then added to it too instead of being yielded.
+        """
+        affected = set()
+        stack = list(changed)
+        while stack:  # Everything which reads a changed variable, directly or through other bindings
+            for name in self.dependents.get(stack.pop(), ()):
+                if name not in affected:
+                    affected.add(name)
+                    stack.append(name)
+
+        waiting = {name: sum(read in affected for read in self.bindings[name].reads) for name in affected}  # Bindings read which are still to be done
+        ready = [name for name, count in waiting.items() if count == 0]
+        time = {name: index for index, name in enumerate(changed)}  # When each variable was last given a value
+        clock = len(changed)
+        self.updates += 1
+        self.full_rerun_nodes += self.total_size
+        self.last_recomputed = self.last_recomputed_nodes = 0
+        while ready:  # Kahn's algorithm over the affected bindings, so a binding comes after the ones it reads
+            name = ready.pop()
+            binding = self.bindings[name]
+            if failed and any(read in failed for read in binding.reads):  # Its value can't be worked out from a binding which failed
+                failed.add(name)
+            elif any(time.get(read, -1) > time.get(name, -1) for read in binding.reads):
+                time[name] = clock
+                clock += 1
+                self.recomputed += 1
+                self.recomputed_nodes += binding.size
+                self.last_recomputed += 1
+                self.last_recomputed_nodes += binding.size
+                yield binding
+            for dependent in self.dependents.get(name, ()):
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0: ready.append(dependent)
+
+    def stats(self):  # How much recomputing the bindings which changed saved over running every binding again, as a JSON friendly dictionary
+        return {
+            "bindings": len(self.bindings),
+            "nodes": self.total_size,
+            "updates": self.updates,
+            "recomputed": self.recomputed,
+            "recomputed_nodes": self.recomputed_nodes,
+            "full_rerun_nodes": self.full_rerun_nodes,
+            "saved": 1 - self.recomputed_nodes / self.full_rerun_nodes if self.full_rerun_nodes else None,
+            "last_recomputed": self.last_recomputed,
+            "last_recomputed_nodes": self.last_recomputed_nodes,
+            "cycles": self.cycles,
+            "invalid": sorted(self.invalid),
+        }
+
+
+# Run functions
+
+def make_global_symbol_table(numbers=None):  # Creates a symbol table holding the built in variables, in the representation of the numeric backend
+    symbol_table = SymbolTable()
+    symbol_table.set("NULL", Number((numbers or default_numbers).literal(0)))
+    return symbol_table
+
+global_symbol_table = make_global_symbol_table()
+
+ENGINES = {  # The engines which can be used to run a program, the tree walking interpreter is kept as the reference
+    "tree": Interpreter,
+    "vm": VirtualMachine,
+    "native": NativeInterpreter,
+    "jit": JitInterpreter,
+    "shared": SharingInterpreter,
+}
+
+program_cache = ProgramCache()  # Shared by the default session so formulas which are run again and again are only lexed and parsed once
+
+
+# Session class
+class Session:
+    """
+    An isolated interpreter state with its own symbol table, root context and program cache, so sessions can run at the same time
+    in different threads or be handed to different tenants. Forking a session is cheap: the fork gets an empty symbol table whose
+    parent is this session's table, so it reads the variables prepared here and its own assignments never leak back.
+    numbers picks the numeric backend, either the name of one in NUMBER_BACKENDS or a backend instance, e.g. PythonNumbers(max_bits=1000).
+    limits are the Limits every run in the session is held to, usage() reports how close the runs came to them.
+    A reactive session keeps the variables assigned by run() up to date with a DependencyGraph, see graph.stats() for what that saved.
+    """
+    def __init__(self, symbol_table=None, engine="tree", optimize=False, cache_size=1024, disk_cache=None, numbers="python", limits=None, reactive=False):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        if isinstance(numbers, str):
+            if numbers not in NUMBER_BACKENDS:
+                raise ValueError(f"Unknown numeric backend '{numbers}', expected one of: {', '.join(NUMBER_BACKENDS)}")
+            numbers = NUMBER_BACKENDS[numbers]() if numbers != "python" else default_numbers
+        if limits is not None and limits.max_bits is not None and numbers.max_bits is not None and limits.max_bits < numbers.max_bits:
+            numbers = copy.copy(numbers)  # The bit limit lowers the max_bits of the session's own copy of the backend
+            numbers.max_bits = limits.max_bits
+        self.numbers = numbers
+        self.symbol_table = symbol_table if symbol_table is not None else make_global_symbol_table(numbers)
+        self.context = Context("<program>")  # Root context of every program run in this session
+        self.context.symbol_table = self.symbol_table
+        self.context.numbers = numbers
+        self.engine = engine
+        self.optimize = optimize
+        self.cache = ProgramCache(cache_size) if cache_size else None  # A cache_size of 0 turns caching off
+        self.disk_cache = disk_cache  # A DiskCache the programs missing from the cache are loaded from, if given
+        self.limits = limits
+        self.runs = 0  # Runs under the limits so far
+        self.limit_errors = 0  # How many of them broke a limit
+        self.last_usage = {}  # What the last run used of each limit
+        self.peak_usage = {}  # The most any run used of each limit
+        self.graph = DependencyGraph() if reactive else None  # The bindings of a reactive session
+
+    def fork(self):  # Creates a copy on write session on top of this one, the fork shares the program cache as programs are never changed
+        symbol_table = SymbolTable()
+        symbol_table.parent = self.symbol_table
+        session = Session(symbol_table, self.engine, self.optimize, cache_size=0, disk_cache=self.disk_cache, numbers=self.numbers, limits=self.limits)
+        session.cache = self.cache
+        if self.graph is not None:  # The fork recomputes the bindings into its own symbol table
+            session.graph = self.graph.copy()
+        return session
+
+    def reset(self):  # Forgets the variables set in this session, a fork falls back to the variables of the session it was forked from
+        self.symbol_table.symbols.clear()
+        if self.symbol_table.parent is None:
+            self.symbol_table.symbols.update(make_global_symbol_table(self.numbers).symbols)
+
+    def set(self, name, value):  # Sets a variable from Python, e.g. to preload a base environment before forking it
+        self.symbol_table.set(name, Number(self.numbers.literal(value)).set_context(self.context))
+        if self.graph is not None:  # The variable is an input from now on, returns the error of recomputing what reads it if there is one
+            self.graph.unbind(name)
+            return self.propagate([name], self.engine)
+
+    def get(self, name):
+        number = self.symbol_table.get(name)
+        return number.value if number is not None else None
+
+    def compile(self, file_name, text, optimize=None, profiler=None):
+        optimize = self.optimize if optimize is None else optimize
+        if self.limits is not None and self.limits.max_source is not None and len(text) > self.limits.max_source:  # Checked before the text is lexed
+            return Program(file_name, text, error=self.source_limit_error(file_name, text))
+        if profiler is not None:  # A profiled program is always lexed and parsed again so those phases can be timed
+            return compile_program(file_name, text, optimize, profiler, self.numbers)
+        if self.cache is None:
+            return self.disk_cache.get(file_name, text, optimize, self.numbers) if self.disk_cache is not None else compile_program(file_name, text, optimize, numbers=self.numbers)
+        return self.cache.get(file_name, text, optimize, self.disk_cache, self.numbers)
+
+    def run(self, file_name, text, engine=None, optimize=None, profiler=None):  # Returns the value of the program and an error if needed
+        return self.run_program(self.compile(file_name, text, optimize, profiler), engine, profiler)
+
+    def run_program(self, program, engine=None, profiler=None):
+        if self.limits is not None:
+            with self.limited_run(program) as budget:
+                return budget.returned(*self.execute_program(program, engine, profiler, budget))
+        return self.execute_program(program, engine, profiler)
+
+    def execute_program(self, program, engine=None, profiler=None, budget=None):
+        if program.error: return None, program.error
+        if budget is not None:
+            error = self.token_limit_error(program)
+            if error: return None, error
+        engine = self.check_engine(engine)
+        if self.graph is not None:
+            return self.execute_reactive(program, engine, profiler)
+        if profiler is not None:
+            return self.profile_program(program, engine, profiler)
+
+        # Running the program by creating an interpreter instance
+        interpreter = ENGINES[engine]()
+        result = interpreter.execute(program.prepare(engine), self.context)
+        return result.value, result.error
+
+    def execute_reactive(self, program, engine, profiler=None):
+        """
+        Runs a program in a reactive session: a program which would make a dependency cycle isn't run, and once it has run its assignments
+        become the bindings of their variables and the bindings which read what it assigned are recomputed. Only the assignments made
+        before a program fails are bound.
+        """
+        assignments = self.graph.assignments(program)
+        error = self.graph.check(assignments, self.context)
+        if error: return None, error
+
+        symbols = self.symbol_table.symbols
+        before = {name: symbols.get(name) for name in assignments}  # Every assignment stores a new Number, which shows which ones were made
+        if profiler is not None:
+            value, error = self.profile_program(program, engine, profiler)
+        else:
+            result = ENGINES[engine]().execute(program.prepare(engine), self.context)
+            value, error = result.value, result.error
+
+        changed = [name for name in assignments if symbols.get(name) is not before[name]]
+        for name in changed:
+            self.graph.bind(assignments[name])
+        propagate_error = self.propagate(changed, engine) if changed else None
+        if error or propagate_error: return None, error or propagate_error
+        return value, None
+
+    def propagate(self, changed, engine):
+        """
+        Recomputes the bindings made stale by assigning the changed variables and returns the first error. A binding which fails keeps its
+        old value, and so do the bindings which read it, which aren't recomputed. All of them are in graph.invalid until they are recomputed
+        again, and every other stale binding is still recomputed.
+        """
+        interpreter = ENGINES[engine]()
+        symbols = self.symbol_table.symbols
+        bindings = self.graph.bindings
+        failed = set()
+        first_error = None
+        for binding in self.graph.stale(changed, failed):
+            prepared = binding.prepared.get(engine)
+            if prepared is None:
+                prepared = binding.prepared[engine] = interpreter.prepare(binding.node.value_node, binding.names)
+            # An assignment inside the value which is no longer its variable's binding mustn't overwrite the variable again
+            kept = [(node.var_name_token.value, symbols.get(node.var_name_token.value)) for node in binding.writes
+                    if getattr(bindings.get(node.var_name_token.value), "node", None) is not node]
+            result = interpreter.execute(prepared, self.context)
+            for name, value in kept:
+                if value is None: symbols.pop(name, None)
+                else: symbols[name] = value
+            if result.error:
+                failed.add(binding.name)
+                first_error = first_error or result.error
+                continue
+            self.symbol_table.set(binding.name, result.value)
+            self.graph.invalid.discard(binding.name)
+        self.graph.invalid |= failed
+        return first_error
+
+    def run_statements(self, file_name, text, engine=None, optimize=None):
+        """
+        Runs the program one statement at a time in this session's context, yielding the value and error of each statement as it
+        completes and stopping after the first error. The program is lexed, parsed and prepared once, like run. Under limits the
+        statements share one budget, as they are one run.
+        """
+        program = self.compile(file_name, text, optimize)
+        if self.limits is None:
+            yield from self.execute_statements(program, engine)
+            return
+        with self.limited_run(program) as budget:
+            for value, error in self.execute_statements(program, engine, budget):
+                yield budget.returned(value, error)
+
+    def execute_statements(self, program, engine=None, budget=None):
+        if program.error:
+            yield None, program.error
+            return
+        if budget is not None:
+            error = self.token_limit_error(program)
+            if error:
+                yield None, error
+                return
+        engine = self.check_engine(engine)
+
+        interpreter = ENGINES[engine]()
+        for prepared in program.prepare_statements(engine):
+            self.context.budget = budget  # Set again for every statement, as another run may have used the context while this generator was paused
+            result = interpreter.execute(prepared, self.context)
+            yield result.value, result.error
+            if result.error: return
+
+    def run_stream(self, file_name, file, engine=None, optimize=None, chunk_size=1 << 16):
+        """
+        Runs a program read from a file object (or memory mapped file) as it is lexed and yields the value and error of each statement,
+        like run_statements. A statement is run as soon as it has been parsed, and its tokens and tree are dropped afterwards, so memory
+        stays flat however long the input is. Errors are reported as the stream reaches them, so the statements before an illegal
+        character or a syntax error have already been run. Streamed programs aren't cached as there is no text to key them by.
+        Under limits the source and token limits are checked as the stream is read, and the whole stream is one run.
+        """
+        engine = self.check_engine(engine)
+        if self.limits is None:
+            yield from self.execute_stream(file_name, file, engine, optimize, chunk_size)
+            return
+        with self.limited_run() as budget:
+            for value, error in self.execute_stream(file_name, file, engine, optimize, chunk_size, budget):
+                yield budget.returned(value, error)
+
+    def execute_stream(self, file_name, file, engine, optimize=None, chunk_size=1 << 16, budget=None):
+        optimize = self.optimize if optimize is None else optimize
+        lexer = StreamLexer(file_name, file, chunk_size)
+        tokens = lexer.make_tokens()
+        if budget is not None:
+            tokens = self.limit_tokens(tokens, lexer, budget)
+        parser = Parser(tokens)
+        interpreter = ENGINES[engine]()
+
+        for statement in parser.statements():
+            if statement.error:
+                while parser.code != TC_NEWLINE and parser.code != TC_EOF:  # An illegal character in the rest of the statement is reported first, like run
+                    parser.advance()
+                lexer.finish_line()
+                yield None, lexer.error or statement.error
+                return
+            if lexer.error:  # The statement was cut short by an illegal character
+                break
+
+            node = Optimizer(self.numbers).optimize(statement.node) if optimize else statement.node
+            self.context.budget = budget
+            result = interpreter.execute(interpreter.prepare(node), self.context)
+            if result.error: lexer.finish_line()
+            yield result.value, result.error
+            if result.error: return
+
+        if lexer.error:  # The illegal character ended the stream with an EOF token, which the parser took as the end of the program
+            lexer.finish_line()
+            yield None, lexer.error
+
+    def limit_tokens(self, tokens, lexer, budget):
+        """
+        Passes the tokens of a stream on while counting them for the budget. A token over the source or token limit ends the stream
+        with an EOF token and sets the LimitError as the lexer's error, so it is reported the way an illegal character would be.
+        """
+        max_source, max_tokens = self.limits.max_source, self.limits.max_tokens
+        for token in tokens:
+            if token.type == T_EOF:
+                budget.source = token.pos_start.index
+                yield token
+                return
+            budget.tokens += 1
+            budget.source = token.pos_end.index
+            if max_tokens is not None and budget.tokens > max_tokens:
+                details = f"Token limit of {max_tokens} reached!"
+            elif max_source is not None and budget.source > max_source:
+                details = f"Source limit of {max_source} characters reached!"
+            else:
+                yield token
+                continue
+            lexer.error = LimitError(token.pos_start, token.pos_end, details, self.context)
+            yield Token(T_EOF, pos_start = token.pos_start)
+            return
+
+    @contextmanager
+    def limited_run(self, program=None):  # Gives the run a fresh budget in this session's context and records what it used once it ends
+        budget = RunBudget(self.limits)
+        if program is not None:
+            budget.source = len(program.text)
+            budget.tokens = program.token_count or 0
+        self.context.budget = budget
+        try:
+            yield budget
+        finally:
+            self.context.budget = None
+            self.record(budget)
+
+    def source_limit_error(self, file_name, text):  # The error for a text over the source limit, pointing at the first character past it
+        max_source = self.limits.max_source
+        source = Source(file_name, text)
+        return LimitError(Position(max_source, source), Position(max_source + 1, source), f"Source limit of {max_source} characters reached!", self.context)
+
+    def token_limit_error(self, program):  # The error for a program over the token limit, pointing at the first token past it
+        max_tokens = self.limits.max_tokens
+        if max_tokens is None or program.token_count is None or program.token_count <= max_tokens: return None
+        count = 0
+        for match in TOKEN_REGEX.finditer(program.text):  # Matched again like Lexer.make_tokens, only up to the token which is needed
+            if match.lastgroup == "SKIP": continue
+            if count == max_tokens: break
+            count += 1
+        source = Source(program.file_name, program.text)
+        return LimitError(Position(match.start(), source), Position(match.end(), source), f"Token limit of {max_tokens} reached!", self.context)
+
+    def record(self, budget):  # Adds a finished run to the counters usage() reports on
+        self.runs += 1
+        if isinstance(budget.error, LimitError): self.limit_errors += 1
+        for name, used in budget.usage().items():
+            self.last_usage[name] = used
+            self.peak_usage[name] = max(self.peak_usage.get(name, used), used)
+
+    def usage(self):
+        """
+        How close the runs of this session came to its limits: the number of runs, how many of them broke a limit and for each limit
+        its value, what the last run used and the most any run used. bits is the bit length of the biggest integer a run returned, its
+        limit is the max_bits of the session's numeric backend. Runs are only counted when the session has limits.
+        """
+        limits = self.limits.report() if self.limits is not None else {}
+        limits["bits"] = self.numbers.max_bits
+        usage = {"runs": self.runs, "limit_errors": self.limit_errors}
+        for name in ("steps", "seconds", "source", "tokens", "bits"):
+            usage[name] = {"limit": limits.get(name), "last": self.last_usage.get(name), "peak": self.peak_usage.get(name)}
+        return usage
+
+    def check_engine(self, engine):  # Returns the engine to use, this session's engine by default
+        engine = engine or self.engine
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        return engine
+
+    def profile_program(self, program, engine, profiler):  # Only the tree walker reports on each node, other engines are timed as a whole
+        interpreter = ProfilingInterpreter(profiler) if engine == "tree" else ENGINES[engine]()
+        with profiler.phase("prepare"):
+            prepared = interpreter.prepare(program.node)
+        with profiler.counting_allocations(), profiler.phase("execute"):
+            result = interpreter.execute(prepared, self.context)
+        return result.value, result.error
+
+
+default_session = Session(global_symbol_table, cache_size=0)  # The session used by run(), it works on the module level global symbol table
+default_session.cache = program_cache
+
+def use_disk_cache(directory):  # Makes run() load and store compiled programs in the directory, None turns the disk cache off again
+    default_session.disk_cache = DiskCache(directory) if directory is not None else None
+    return default_session.disk_cache
+
+def run(file_name, text, engine="tree", optimize=False, profiler=None):  # This is going to get the input text and return the result of the program and an error if needed
+    return default_session.run(file_name, text, engine, optimize, profiler)
+
+def run_statements(file_name, text, engine="tree", optimize=False):  # Yields the value and error of each statement as it completes
+    return default_session.run_statements(file_name, text, engine, optimize)
+
+def run_stream(file_name, file, engine="tree", optimize=False, chunk_size=1 << 16):  # The streaming version of run, e.g. run_stream("<stdin>", sys.stdin)
+    return default_session.run_stream(file_name, file, engine, optimize, chunk_size)
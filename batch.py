@@ -0,0 +1,311 @@
+# Batch evaluation of one expression over many rows of variable bindings using NumPy arrays
+import math
+
+import numpy as np
+
+import basic
+
+
+POWER_UFUNC = np.frompyfunc(pow, 2, 1)  # Python's pow as a NumPy ufunc
+INT64 = np.iinfo(np.int64)
+EXACT_FLOAT_INT = 1 << 53  # Ints up to this size are converted to floats exactly, so NumPy divides them like Python does
+
+OPERATIONS = {  # The method of the numeric backend which works out each binary operation for one row
+    basic.T_PLUS: "add",
+    basic.T_MINUS: "subtract",
+    basic.T_MUL: "multiply",
+    basic.T_DIV: "divide",
+    basic.T_POWER: "power",
+}
+
+
+class AllRowsFailed(Exception):  # Raised to stop the evaluation early once every row has failed
+    pass
+
+
+# Batch result class
+class BatchResult:  # Holds the value of every row and the rows which failed with a runtime error
+    def __init__(self, values, failed, error_index, errors):
+        self.values = values  # The result of each row, the value of a failed row is meaningless
+        self.failed = failed  # Boolean mask of the rows which raised an error
+        self.error_index = error_index  # For each failed row, the index into errors of the error it raised (-1 for rows which succeeded)
+        self.errors = errors  # One RunTimeError per place in the expression that failed, shared by all the rows that failed there
+
+    def error(self, row):  # Returns the error raised by the row, or None if it succeeded
+        index = self.error_index[row]
+        return self.errors[index] if index >= 0 else None
+
+    def masked(self):  # The values as a masked array with the failed rows masked out
+        return np.ma.masked_array(self.values, self.failed)
+
+    def __len__(self):
+        return len(self.values)
+
+
+# Batch interpreter class
+class BatchInterpreter:
+    """
+    Evaluates an expression for many rows at once, each node is evaluated as one NumPy array operation instead of once per row.
+    Every row gets the value and error the scalar engines give, with the context's numeric backend: an operation which can't overflow
+    NumPy's int64 or differ from Python's float arithmetic is done on the whole arrays, any other one is done row by row by the backend
+    (see elementwise), so integers grow like Python's and the backend's limits apply. A row which raises an error, e.g. a division
+    by 0 or an integer over max_bits, fails on its own and the other rows carry on. Big integers are kept in arrays with dtype=object.
+    """
+    def __init__(self, bindings, size, context):
+        self.bindings = bindings
+        self.context = context
+        self.numbers = context.numbers
+        self.failed = np.zeros(size, dtype=bool)
+        self.error_index = np.full(size, -1, dtype=np.intp)
+        self.errors = []
+        self.contexts = []  # The context of each value on the stack, an error is reported in its left operand's like NativeInterpreter does
+        self.binding_contexts = {}  # The context of each variable assigned by the expression
+
+    def evaluate(self, node):  # Visits the nodes in post order, each visit takes the values of its child nodes off the stack and pushes its own
+        values = []
+        budget = self.context.budget
+        step = budget.steps if budget else 0  # Every node is a step, as the batch evaluates each of them once
+        check_at = budget.next_check(step) if budget else math.inf
+        try:
+            for child in basic.postorder(node):
+                step += 1
+                if step >= check_at:
+                    error = budget.check(step, child.pos_start, child.pos_end, self.context)
+                    if error: self.fail(np.ones_like(self.failed), error)
+                    check_at = budget.next_check(step)
+                self.visit(child, values)
+        finally:
+            if budget: budget.steps = step
+        return values.pop()
+
+    def visit(self, node, values):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        method(node, values)
+
+    def no_visit_method(self, node, values):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    def fail(self, rows, error):  # Records the error for the rows which haven't already failed earlier in the evaluation
+        new_rows = rows & ~self.failed
+        if new_rows.any():
+            self.error_index[new_rows] = len(self.errors)
+            self.errors.append(error)
+            self.failed |= new_rows
+            if self.failed.all():  # Nothing is left to evaluate
+                raise AllRowsFailed()
+
+    def visit_NumberNode(self, node, values):
+        try:
+            values.append(self.numbers.literal(node.tok.value))
+        except ArithmeticError as exception:  # A literal the backend can't represent fails every row
+            self.fail(np.ones_like(self.failed), basic.number_error(exception, node.pos_start, node.pos_end, self.context))
+        self.contexts.append(self.context)
+
+    def visit_VarAccessNode(self, node, values):
+        var_name = node.var_name_token.value
+        if var_name in self.bindings:
+            values.append(self.bindings[var_name])
+            self.contexts.append(self.binding_contexts.get(var_name, self.context))
+            return
+
+        value = self.context.symbol_table.get(var_name)  # Variables which aren't bound per row come from the symbol table, e.g. NULL
+        if value is None:  # Every row which is still running fails here
+            self.fail(np.ones_like(self.failed), basic.RunTimeError(node.pos_start, node.pos_end, f"'{var_name}' is not defined!", self.context))
+        values.append(value.value)
+        self.contexts.append(value.context)
+
+    def visit_VarAssignNode(self, node, values):  # Assignments are bound for the rest of the expression but aren't written to the symbol table
+        self.bindings[node.var_name_token.value] = values[-1]
+        self.binding_contexts[node.var_name_token.value] = self.contexts[-1]
+
+    def visit_StatementsNode(self, node, values):  # The result is the value of the last statement
+        del values[len(values) - len(node.statement_nodes):-1]
+        del self.contexts[len(self.contexts) - len(node.statement_nodes):-1]
+
+    def visit_BinaryOpNode(self, node, values):
+        self.contexts.pop()  # The result has the context of the left operand
+        values.append(self.operate(node, values.pop(-2), values.pop(), self.contexts[-1]))
+
+    def operate(self, node, left, right, context):
+        op_type = node.op_token.type
+
+        if op_type == basic.T_DIV:
+            zero = np.broadcast_to(np.equal(right, 0), self.failed.shape)
+            if zero.any():
+                value_node = node.right_node
+                while isinstance(value_node, basic.VarAssignNode):  # The error points at the value of the divisor, like the interpreter
+                    value_node = value_node.value_node
+                self.fail(zero, basic.RunTimeError(value_node.pos_start, value_node.pos_end, "Division by 0!", context))
+                right = np.where(zero, 1, right)  # The failed rows are divided by 1 instead
+
+        operation = getattr(self.numbers, OPERATIONS[op_type])
+        if not isinstance(left, np.ndarray) and not isinstance(right, np.ndarray):  # Constant subtrees are worked out once, like one row
+            try:
+                return operation(left, right)
+            except ArithmeticError as exception:
+                self.fail(np.ones_like(self.failed), basic.NativeInterpreter().number_error(node, exception, context, self.context))
+
+        value = self.vectorized(op_type, left, right)
+        if value is not None:
+            return value
+        return self.elementwise(node, operation, (left, right), context)
+
+    def vectorized(self, op_type, left, right):
+        """
+        The operation done by NumPy on the whole arrays, or None if it could give another value than the backend for some row. Floats
+        are IEEE doubles either way, apart from a power which Python works out differently. Ints are only done by NumPy when the
+        smallest and biggest values of the operands show that no row can overflow int64 or go over the backend's max_bits.
+        """
+        left_kind, right_kind = self.kind(left), self.kind(right)
+        if left_kind is None or right_kind is None:
+            return None
+        if "f" in (left_kind, right_kind):  # An int operand is rounded to a float by Python and NumPy alike
+            if op_type == basic.T_PLUS: return np.add(left, right)
+            elif op_type == basic.T_MINUS: return np.subtract(left, right)
+            elif op_type == basic.T_MUL: return np.multiply(left, right)
+            elif op_type == basic.T_DIV: return np.true_divide(left, right)
+            if type(self.numbers) is basic.FloatNumbers:  # Its power fails for a complex result
+                return None
+            try:  # NumPy's power can differ from Python's pow in the last bit, so pow is applied to each row, unless one of them raises
+                values = POWER_UFUNC(left, right)
+            except ArithmeticError:
+                return None
+            return self.tidy(values, set(map(type, values)))
+
+        if op_type == basic.T_DIV:  # Python divides two ints exactly before rounding, NumPy converts them to floats first
+            if type(self.numbers) is basic.ExactNumbers:  # Which gives a fraction
+                return None
+            (left_low, left_high), (right_low, right_high) = self.bounds(left), self.bounds(right)
+            if max(-left_low, left_high, -right_low, right_high) > EXACT_FLOAT_INT:
+                return None
+            return np.true_divide(left, right)
+
+        (left_low, left_high), (right_low, right_high) = self.bounds(left), self.bounds(right)
+        if op_type == basic.T_PLUS:
+            extremes = (left_low + right_low, left_high + right_high)
+        elif op_type == basic.T_MINUS:
+            extremes = (left_low - right_high, left_high - right_low)
+        elif op_type == basic.T_MUL:
+            extremes = (left_low * right_low, left_low * right_high, left_high * right_low, left_high * right_high)
+        else:  # A power of ints is only exact in NumPy for exponents which are not negative, with a result which fits
+            if right_low < 0:
+                return None
+            extremes = (max(abs(left_low), abs(left_high)) ** min(right_high, 64),)
+        max_bits = self.numbers.max_bits if self.numbers.max_bits is not None else 63
+        if max(abs(value) for value in extremes).bit_length() > min(max_bits, 62):
+            return None
+        if op_type == basic.T_PLUS: return np.add(left, right, dtype=np.int64)
+        elif op_type == basic.T_MINUS: return np.subtract(left, right, dtype=np.int64)
+        elif op_type == basic.T_MUL: return np.multiply(left, right, dtype=np.int64)
+        return np.power(left, right, dtype=np.int64)
+
+    def kind(self, value):  # "i" for ints which fit in an int64, "f" for floats and None for anything NumPy can't work out like the backend
+        if isinstance(value, np.ndarray):
+            if value.dtype == np.int64: return "i"
+            return "f" if value.dtype == np.float64 else None
+        if type(value) is int: return "i" if INT64.min <= value <= INT64.max else None
+        return "f" if type(value) is float else None
+
+    def bounds(self, value):  # The smallest and biggest value of an operand, as Python numbers
+        if isinstance(value, np.ndarray):
+            return value.min().item(), value.max().item()
+        return value, value
+
+    def elementwise(self, node, operation, operands, context):
+        """
+        Works out the operation row by row with the numeric backend, so each row's value is exactly the scalar engines' one. A row for
+        which the backend raises an ArithmeticError fails with the runtime error the scalar engines report, one error for each message.
+        Rows which failed earlier are worked out on 1s instead, so they can't raise again.
+        """
+        if self.failed.any():
+            operands = [np.where(self.failed, 1, self.object_array(operand)) for operand in operands]
+
+        def apply(*row):
+            try:
+                return operation(*row)
+            except ArithmeticError as exception:
+                return exception
+
+        values = np.frompyfunc(apply, len(operands), 1)(*operands)
+        values = np.array(np.broadcast_to(values, self.failed.shape))
+        types = set(map(type, values))
+        if any(issubclass(value_type, ArithmeticError) for value_type in types):
+            errors = {}
+            for row, value in enumerate(values):
+                if isinstance(value, ArithmeticError):
+                    errors.setdefault((type(value), str(value)), (value, []))[1].append(row)
+                    values[row] = 1
+            for exception, rows in errors.values():
+                mask = np.zeros_like(self.failed)
+                mask[rows] = True
+                self.fail(mask, basic.NativeInterpreter().number_error(node, exception, context, self.context))
+            types = set(map(type, values))
+        return self.tidy(values, types)
+
+    def object_array(self, operand):  # An int too big for int64 can't be put in a NumPy array by np.where, so it is spread over an object array first
+        if type(operand) is int and not INT64.min <= operand <= INT64.max:
+            return np.full(self.failed.shape, operand, dtype=object)
+        return operand
+
+    def tidy(self, values, types):  # Turns the results of elementwise back into a float or int64 array when every row's value fits one
+        if types == {float}:
+            return values.astype(np.float64)
+        if types == {int} and INT64.min <= min(values) and max(values) <= INT64.max:
+            return values.astype(np.int64)
+        return values
+
+    def visit_UnaryOpNode(self, node, values):
+        if node.op_token.type == basic.T_MINUS:
+            value = values.pop()
+            kind = self.kind(value)
+            if not isinstance(value, np.ndarray):
+                try:
+                    values.append(self.numbers.negate(value))
+                except ArithmeticError as exception:
+                    self.fail(np.ones_like(self.failed), basic.NativeInterpreter().number_error(node, exception, self.contexts[-1], self.context))
+            elif kind == "f" or kind == "i" and value.min() > INT64.min:
+                values.append(np.multiply(value, -1))
+            else:
+                values.append(self.elementwise(node, self.numbers.negate, (value,), self.contexts[-1]))
+
+
+def column(values):
+    """
+    The values of a binding as an array NumPy works out like the scalar engines: smaller ints and unsigned ints widened to int64 (so negating
+    or subtracting can't wrap around or go out of bounds), uint64s too big for an int64 as Python ints and smaller floats widened to float64.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "u" and values.dtype.itemsize == 8 and values.size and values.max() > INT64.max:
+        return values.astype(object)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    return values.astype(np.float64) if values.dtype.kind == "f" else values
+
+
+def evaluate_batch(node, bindings, context=None):
+    """
+    Evaluates a parsed expression once for every row of the bindings, which map variable names to equally long 1D arrays (or scalars).
+    Returns a BatchResult.
+    """
+    bindings = {name: column(values) for name, values in bindings.items()}
+    size = np.broadcast_shapes(*(values.shape for values in bindings.values()), (1,))[0]
+    if context is None:
+        context = basic.Context("<program>")
+        context.symbol_table = basic.global_symbol_table
+
+    interpreter = BatchInterpreter(bindings, size, context)
+    if size == 0:
+        return BatchResult(np.zeros(0), interpreter.failed, interpreter.error_index, interpreter.errors)
+    try:
+        with np.errstate(all="ignore"):  # A float overflowing to inf or a nan isn't an error for the scalar engines either
+            values = np.array(np.broadcast_to(interpreter.evaluate(node), (size,)))  # Copied so constant results are writable
+    except AllRowsFailed:
+        values = np.zeros(size)
+    return BatchResult(values, interpreter.failed, interpreter.error_index, interpreter.errors)
+
+
+def run_batch(file_name, text, bindings, optimize=False):  # The batch version of basic.run, returns a BatchResult and an error
+    program = basic.program_cache.get(file_name, text, optimize, basic.default_session.disk_cache)
+    if program.error: return None, program.error
+    return evaluate_batch(program.node, bindings), None
@@ -0,0 +1,625 @@
+# Benchmarks for the interpreter, e.g. python benchmark.py lexer --megabytes 4
+# The suite times every phase on synthetic workloads and can save a JSON baseline to compare later changes against:
+#   python benchmark.py suite --save baseline.json
+#   python benchmark.py compare --baseline baseline.json --engine vm
+from contextlib import contextmanager
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import basic
+
+
+# Workload generators
+def generate_expression(megabytes):  # Builds one long valid expression of roughly the requested size
+    chunk = "12 + 3.75 * alpha_1 - (456 / beta) ^ 2 + "
+    repeats = max(1, int(megabytes * 1024 * 1024) // len(chunk))
+    return chunk * repeats + "1"
+
+
+def generate_nested_brackets(scale):  # (1 + (1 + (1 + ... )))
+    depth = 50 * scale
+    return "(1 + " * depth + "1" + ")" * depth, {}
+
+
+def generate_operator_chain(scale):  # A long chain of + and * between integers
+    terms = 200 * scale
+    return " + ".join(f"{index} * {index + 1}" for index in range(terms // 2)), {}
+
+
+def generate_assignments(scale):  # (VAR v0 = 0) + (VAR v1 = 1) + ...
+    count = 100 * scale
+    return " + ".join(f"(VAR v{index} = {index})" for index in range(count)), {}
+
+
+def generate_float_literals(scale):  # Long floating point literals
+    terms = 200 * scale
+    return " + ".join(f"{index}123456.7890123456" for index in range(terms)), {}
+
+
+def generate_identifiers(scale):  # Long identifier names, with the variables they read preloaded
+    terms = 200 * scale
+    names = [f"identifier_number_{index}_of_the_workload" for index in range(terms)]
+    return " + ".join(names), {name: index for index, name in enumerate(names)}
+
+
+WORKLOADS = {
+    "nested_brackets": generate_nested_brackets,
+    "operator_chain": generate_operator_chain,
+    "assignments": generate_assignments,
+    "float_literals": generate_float_literals,
+    "identifiers": generate_identifiers,
+}
+
+
+def best_time(func, repeat):  # Returns the fastest of several runs, which is the least noisy estimate
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()  # Like timeit, the garbage collector is turned off so its pauses don't swamp the measurement
+        try:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Benchmarks
+def bench_lexer(args):
+    text = generate_expression(args.megabytes)
+    size = len(text) / (1024 * 1024)
+    charwise = best_time(lambda: basic.Lexer("<bench>", text).make_tokens_charwise(), args.repeat)
+    table = best_time(lambda: basic.Lexer("<bench>", text).make_tokens(), args.repeat)
+    print(f"Lexing {size:.2f} MB")
+    print(f"  make_tokens_charwise: {charwise:.3f}s ({size / charwise:.2f} MB/s)")
+    print(f"  make_tokens:          {table:.3f}s ({size / table:.2f} MB/s)")
+    print(f"  speedup:              {charwise / table:.2f}x")
+
+
+SLOTTED_CLASSES = ("Position", "Token", "NumberNode", "VarAccessNode", "VarAssignNode", "BinaryOpNode", "UnaryOpNode", "Number")
+
+@contextmanager
+def dict_backed_classes():
+    """
+    Temporarily swaps the slotted classes in basic for plain subclasses, which get a __dict__ again. The subclasses still keep the slots of
+    their parent, so the attributes are stored in the slots and the __dict__ stays empty: the "with __dict__" numbers approximate the old
+    dict-backed classes by what a __dict__ (and __weakref__) costs on top of the slotted object, not by the exact old layout.
+    """
+    originals = {name: getattr(basic, name) for name in SLOTTED_CLASSES}
+    for name, cls in originals.items():
+        setattr(basic, name, type(name, (cls,), {}))
+    try:
+        yield
+    finally:
+        for name, cls in originals.items():
+            setattr(basic, name, cls)
+
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for child in ("left_node", "right_node", "node", "value_node"):
+            if hasattr(node, child):
+                stack.append(getattr(node, child))
+    return count
+
+
+def measure_memory(text):  # Returns the bytes allocated per token of the TokenBuffer, per Token object and per AST node, measured with tracemalloc
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tokens, error = basic.Lexer("<bench>", text).make_tokens()
+        after_lexing = tracemalloc.get_traced_memory()[0]
+        token_list = list(tokens)  # The lexer only keeps columns now, so the Token objects (each with two Positions) are made from them
+        after_listing = tracemalloc.get_traced_memory()[0]
+        ast = basic.Parser(tokens).parse()
+        after_parsing = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    count = len(tokens)
+    return (after_lexing - before) / count, (after_listing - after_lexing) / count, (after_parsing - after_listing) / count_nodes(ast.node)
+
+
+def bench_memory(args):
+    text = generate_expression(args.megabytes)
+    with dict_backed_classes():
+        buffer, token_before, node_before = measure_memory(text)
+    buffer, token_after, node_after = measure_memory(text)
+    print(f"Memory for a {len(text) / (1024 * 1024):.2f} MB program")
+    print(f"  bytes per Token:    {token_before:7.1f} with __dict__, {token_after:7.1f} with __slots__, {buffer:7.1f} in a TokenBuffer")
+    print(f"  bytes per AST node: {node_before:7.1f} with __dict__, {node_after:7.1f} with __slots__")
+
+
+def bench_profiler(args):  # Shows that a run without a profiler costs the same as running the engine directly
+    text = generate_expression(0.02)
+    session = basic.Session()
+    session.set("alpha_1", 2)  # The variables the expression reads, otherwise every run stops at the first one
+    session.set("beta", 4)
+    program = session.compile("<bench>", text)
+    interpreter = basic.Interpreter()
+    runs = 100
+
+    bare = best_time(lambda: [interpreter.execute(program.node, session.context) for _ in range(runs)], args.repeat)
+    off = best_time(lambda: [session.run_program(program) for _ in range(runs)], args.repeat)
+    on = best_time(lambda: [session.run_program(program, profiler=basic.Profiler()) for _ in range(runs)], args.repeat)
+    print(f"Running a {len(text) / 1024:.1f} KB program {runs} times")
+    print(f"  Interpreter.execute: {bare:.3f}s")
+    print(f"  profiling off:       {off:.3f}s ({(off / bare - 1) * 100:+.1f}%)")
+    print(f"  profiling on:        {on:.3f}s ({(on / bare - 1) * 100:+.1f}%)")
+
+
+def bench_engines(args):  # Times each engine on arithmetic heavy programs and counts the Number objects each of them creates
+    text = generate_expression(0.02)
+    programs = {"expression": (text, {"alpha_1": 2, "beta": 4})}
+    for name in ("operator_chain", "nested_brackets", "identifiers"):
+        programs[name] = WORKLOADS[name](args.scale)
+    runs = 50
+
+    for name, (text, variables) in programs.items():
+        session = basic.Session()
+        for var_name, value in variables.items():
+            session.set(var_name, value)
+        program = session.compile("<bench>", text)
+        print(f"{name} ({len(text) / 1024:.1f} KB), {runs} runs")
+        for engine in basic.ENGINES:
+            program.prepare(engine)
+            seconds = best_time(lambda: [session.run_program(program, engine) for _ in range(runs)], args.repeat)
+            profiler = basic.Profiler()
+            with profiler.counting_allocations():
+                session.run_program(program, engine)
+            print(f"  {engine:<8} {seconds / runs * 1000:8.3f} ms per run, {profiler.allocations['Number']:6} Numbers, {profiler.allocations['RunTimeResult']:6} RunTimeResults")
+
+
+def bench_jit(args):  # Times Interpreter.visit and each engine on evaluating the same programs again and again, and what compiling costs the JIT
+    programs = {"formula": ("VAR x = alpha_1 * 3 + beta / 2 - (alpha_1 - beta) ^ 2 : x * x + -x", {"alpha_1": 2, "beta": 4})}
+    for name in ("operator_chain", "assignments", "identifiers"):
+        programs[name] = WORKLOADS[name](1)  # Interpreter.visit recurses, so the programs are kept shallow
+    runs = 2000
+
+    for name, (text, variables) in programs.items():
+        session = basic.Session()
+        for var_name, value in variables.items():
+            session.set(var_name, value)
+        program = session.compile("<bench>", text)
+        print(f"{name} ({len(text) / 1024:.1f} KB), {runs} runs")
+        interpreter = basic.Interpreter()
+        visit = best_time(lambda: [interpreter.visit(program.node, session.context) for _ in range(runs)], args.repeat)
+        print(f"  {'visit':<8} {visit / runs * 1000:8.3f} ms per run")
+        for engine in basic.ENGINES:
+            program.prepare(engine)
+            session.run_program(program, engine)  # Hot, so the JIT has compiled the program
+            seconds = best_time(lambda: [session.run_program(program, engine) for _ in range(runs)], args.repeat)
+            print(f"  {engine:<8} {seconds / runs * 1000:8.3f} ms per run ({visit / seconds:5.1f}x visit)")
+        jitted = basic.JitInterpreter().prepare(program.node)
+        compiling = best_time(jitted.compile, args.repeat)
+        print(f"  compiling for the jit took {compiling * 1000:.3f} ms")
+
+
+def bench_sharing(args):  # Times the tree walker against the sharing engine on formulas which repeat subexpressions, and on one which doesn't
+    term = "(alpha * beta + gamma) * (alpha - gamma) / (beta + 1)"
+    programs = {
+        "ten copies": " + ".join(f"({term}) * {index}" for index in range(10)),
+        "nested copies": "(" * 20 + term + "".join(f" + {term}) * {index}" for index in range(20)),
+        "copies between assignments": " + ".join(f"({term}) + (VAR alpha = {index})" for index in range(20)),
+        "operator_chain": WORKLOADS["operator_chain"](args.scale)[0],  # Hardly anything to share, shows what interning costs
+    }
+    session = basic.Session()
+    for name, value in (("alpha", 2), ("beta", 3), ("gamma", 5)):
+        session.set(name, value)
+    runs = 200
+    for label, text in programs.items():
+        program = session.compile("<bench>", text)
+        print(f"{label} ({len(text) / 1024:.1f} KB), {runs} runs")
+        for engine in ("tree", "shared"):
+            program.prepare(engine)
+            seconds = best_time(lambda: [session.fork().run_program(program, engine) for _ in range(runs)], args.repeat)
+            print(f"  {engine:<8} {seconds / runs * 1000:8.3f} ms per run")
+        interning = best_time(lambda: basic.SharingInterpreter().prepare(program.node), args.repeat)
+        print(f"  interning and resolving took {interning * 1000:.3f} ms")
+
+
+def bench_reactive(args):  # Changes one input of a session with many bindings, recomputing what reads it against running every binding again
+    inputs, chain = 20, 50
+    lines = [f"VAR input_{index} = {index}" for index in range(inputs)]
+    for index in range(inputs):  # A chain of bindings per input, each link also reads the next input
+        for link in range(chain):
+            previous = f"value_{index}_{link - 1}" if link else f"input_{index}"
+            lines.append(f"VAR value_{index}_{link} = {previous} * 3 + input_{(index + 1) % inputs} - {link}")
+    session = basic.Session()
+    reactive = basic.Session(reactive=True)
+    for line in lines:
+        session.run("<bench>", line)
+        reactive.run("<bench>", line)
+    runs = 20
+    changes = [f"VAR input_0 = {value}" for value in range(runs)]
+    full = best_time(lambda: [[session.run("<bench>", line) for line in [change] + lines[inputs:]] for change in changes], args.repeat)
+    recompute = best_time(lambda: [reactive.run("<bench>", change) for change in changes], args.repeat)
+    stats = reactive.graph.stats()
+    print(f"{len(lines)} bindings, changing one input {runs} times")
+    print(f"  run every binding again {full / runs * 1000:8.3f} ms per change")
+    print(f"  reactive                {recompute / runs * 1000:8.3f} ms per change ({full / recompute:.1f}x)")
+    print(f"  recomputed {stats['last_recomputed']} bindings per change, {stats['last_recomputed_nodes']} of the {stats['nodes']} nodes of all bindings")
+
+
+def bench_variables(args):  # Times variable heavy programs read through a chain of forked sessions, per access lookups against resolved slots
+    names = [f"identifier_number_{index}_of_the_workload" for index in range(200)]
+    programs = {
+        "identifiers": " + ".join(names),  # Every name read once
+        "repeated reads": " + ".join(f"{names[index % 4]} * {names[(index + 1) % 4]}" for index in range(200)),  # A few names read many times
+        "assignments": " + ".join(f"(VAR {names[index % 10]} = {names[index % 10]} + 1)" for index in range(200)),
+    }
+    base = basic.Session()
+    for index, name in enumerate(names):
+        base.set(name, index)
+    session = base.fork().fork()  # Names are found two tables up the chain
+    runs = 200
+    for label, text in programs.items():
+        program = session.compile("<bench>", text)
+        interpreter = basic.Interpreter()
+        lookups = best_time(lambda: [interpreter.visit(program.node, session.context) for _ in range(runs)], args.repeat)  # Looks every access up by name
+        print(f"{label} ({len(text) / 1024:.1f} KB), {runs} runs")
+        print(f"  dict lookups (visit) {lookups / runs * 1000:8.3f} ms per run")
+        for engine in basic.ENGINES:
+            program.prepare(engine)
+            seconds = best_time(lambda: [session.run_program(program, engine) for _ in range(runs)], args.repeat)
+            print(f"  slots ({engine}){' ' * (13 - len(engine))}{seconds / runs * 1000:8.3f} ms per run")
+
+
+def bench_nesting(args):  # Compares the recursive parser and tree walker with the iterative ones, then runs programs too deep for recursion
+    depth = 100  # The recursive parser nests five calls per bracket, so this stays well inside the recursion limit
+    for name, text in (("brackets", "(1 + " * depth + "1" + ")" * depth), ("unary minus", "-" * depth + "5")):
+        tokens, error = basic.Lexer("<bench>", text).make_tokens()
+        node = basic.Parser(tokens).parse().node
+        context = basic.Session().context
+        runs = 200
+        parse_recursive = best_time(lambda: [basic.Parser(tokens).parse_recursive() for _ in range(runs)], args.repeat)
+        parse = best_time(lambda: [basic.Parser(tokens).parse() for _ in range(runs)], args.repeat)
+        visit = best_time(lambda: [basic.Interpreter().visit(node, context) for _ in range(runs)], args.repeat)
+        execute = best_time(lambda: [basic.Interpreter().execute(node, context) for _ in range(runs)], args.repeat)
+        print(f"{name} nested {depth} deep, {runs} runs")
+        print(f"  Parser.parse_recursive: {parse_recursive:.3f}s, Parser.parse:        {parse:.3f}s ({parse_recursive / parse:.2f}x)")
+        print(f"  Interpreter.visit:      {visit:.3f}s, Interpreter.execute: {execute:.3f}s ({visit / execute:.2f}x)")
+
+    for depth in (10_000, 100_000):
+        text = "(1 + " * depth + "1" + ")" * depth
+        seconds = best_time(lambda: basic.Session(cache_size=0).run("<bench>", text), 1)
+        print(f"  {depth} nested brackets: {seconds:.3f}s")
+
+
+def bench_statements(args):  # Runs a script of many lines once per line, as one program and one statement at a time
+    lines = [f"VAR v{index % 100} = {index} * 2 + {index % 7}" for index in range(100_000 * args.scale)]
+    text = "\n".join(lines)
+    per_line = best_time(lambda: [basic.Session(cache_size=0).run("<bench>", line) for line in lines], args.repeat)
+    whole = best_time(lambda: basic.Session(cache_size=0).run("<bench>", text), args.repeat)
+    statements = best_time(lambda: list(basic.Session(cache_size=0).run_statements("<bench>", text)), args.repeat)
+    streamed = best_time(lambda: list(basic.Session(cache_size=0).run_stream("<bench>", io.StringIO(text))), args.repeat)
+    print(f"Running a {len(lines)} line script")
+    print(f"  run per line:   {per_line:.3f}s")
+    print(f"  run:            {whole:.3f}s ({per_line / whole:.2f}x)")
+    print(f"  run_statements: {statements:.3f}s ({per_line / statements:.2f}x)")
+    print(f"  run_stream:     {streamed:.3f}s ({per_line / streamed:.2f}x)")
+
+
+def bench_startup(args):  # Compiles a set of scripts without a disk cache, into an empty one (cold start) and from a filled one (warm start)
+    scripts = {f"script_{index}.bas": generate_expression(0.01) for index in range(200 * args.scale)}
+    size = sum(len(text) for text in scripts.values()) / (1024 * 1024)
+    directory = tempfile.mkdtemp()
+    try:
+        plain = best_time(lambda: [basic.compile_program(name, text) for name, text in scripts.items()], args.repeat)
+
+        start = time.perf_counter()
+        cold_cache = basic.DiskCache(directory)
+        for name, text in scripts.items():
+            cold_cache.get(name, text)
+        cold = time.perf_counter() - start
+
+        warm = best_time(lambda: [basic.DiskCache(directory).get(name, text) for name, text in scripts.items()], args.repeat)
+        entries = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / (1024 * 1024)
+    finally:
+        shutil.rmtree(directory)
+    print(f"Compiling {len(scripts)} scripts ({size:.2f} MB of source, {entries:.2f} MB of cache entries)")
+    print(f"  no disk cache: {plain:.3f}s")
+    print(f"  cold start:    {cold:.3f}s")
+    print(f"  warm start:    {warm:.3f}s ({plain / warm:.2f}x)")
+
+
+def bench_numbers(args):  # Times each numeric backend on the same program, then how long the default one takes to refuse costly powers
+    text = generate_expression(0.02)
+    runs = 50
+    print(f"expression ({len(text) / 1024:.1f} KB), {runs} runs")
+    for numbers in basic.NUMBER_BACKENDS:
+        session = basic.Session(numbers=numbers)
+        session.set("alpha_1", 2)
+        session.set("beta", 4)
+        program = session.compile("<bench>", text)
+        for engine in basic.ENGINES:
+            program.prepare(engine)
+            seconds = best_time(lambda: [session.run_program(program, engine) for _ in range(runs)], args.repeat)
+            print(f"  {numbers:<6} {engine:<8} {seconds / runs * 1000:8.3f} ms per run")
+
+    session = basic.Session()
+    for text in ("2^1000000", "(2^2)^(2^20)", "VAR a = 3^8000 : a * a"):
+        start = time.perf_counter()
+        value, error = session.run("<bench>", text)
+        print(f"  {text:<24} refused in {(time.perf_counter() - start) * 1000:.3f} ms: {error.details if error else value}")
+
+
+def bench_limits(args):  # Times each engine with and without limits which aren't reached, then how soon a run over a limit is stopped
+    text = generate_expression(0.02)
+    runs = 50
+    limits = basic.Limits(max_steps=10 ** 9, timeout=3600, max_tokens=10 ** 9)
+    print(f"expression ({len(text) / 1024:.1f} KB), {runs} runs")
+    for engine in basic.ENGINES:
+        times = []
+        for session in (basic.Session(engine=engine), basic.Session(engine=engine, limits=limits)):
+            session.set("alpha_1", 2)
+            session.set("beta", 4)
+            program = session.compile("<bench>", text)
+            program.prepare(engine)
+            times.append(best_time(lambda: [session.run_program(program) for _ in range(runs)], args.repeat))
+        print(f"  {engine:<8} no limits {times[0] / runs * 1000:8.3f} ms, limits {times[1] / runs * 1000:8.3f} ms per run ({(times[1] / times[0] - 1) * 100:+.1f}%)")
+
+    text, bindings = generate_operator_chain(200)
+    program = basic.Session().compile("<bench>", text)
+    print(f"operator chain ({len(text) / 1024:.1f} KB), compiled once")
+    for limits in (basic.Limits(max_steps=1000), basic.Limits(timeout=0.001), basic.Limits(max_tokens=1000)):
+        session = basic.Session(limits=limits)
+        start = time.perf_counter()
+        value, error = session.run_program(program)
+        print(f"  {error.details if error else value} stopped in {(time.perf_counter() - start) * 1000:.3f} ms")
+
+
+def bench_server(args):  # Sends requests to a local server from many clients at once, half of them repeats which the server runs once
+    import server
+
+    async def client(port, texts):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write("".join(json.dumps({"id": index, "text": text}) + "\n" for index, text in enumerate(texts)).encode("utf-8"))
+        await writer.drain()
+        for _ in texts:
+            await reader.readline()
+        writer.close()
+
+    async def run(workers):
+        instance = server.Server(workers=workers)
+        listener = await instance.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        clients, requests = 16, 500
+        texts = [[f"VAR a = {index % 50} : a * a + {client_index % 2}" for index in range(requests)] for client_index in range(clients)]
+        await client(port, ["1 + 1"] * 10)  # Warms up the worker processes
+        start = time.perf_counter()
+        await asyncio.gather(*(client(port, client_texts) for client_texts in texts))
+        seconds = time.perf_counter() - start
+        metrics = instance.metrics()
+        await instance.close()
+        print(f"  {'thread' if workers == 0 else f'{instance.workers} workers':<10} {clients * requests / seconds:9.0f} requests/s, "
+              f"p50 {metrics['p50_ms']:.2f} ms, p99 {metrics['p99_ms']:.2f} ms, {metrics['deduplicated']} deduplicated, mean batch {metrics['mean_batch_size']:.1f}")
+
+    for workers in (0, None):
+        asyncio.run(run(workers))
+
+
+def peak_memory(func):  # Returns the result of func and the peak memory traced while it ran
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def bench_tokens(args):  # Compares the columns of a TokenBuffer with a list of Token objects, in memory and in parsing time
+    text = generate_expression(args.megabytes)
+    buffer, buffer_peak = peak_memory(lambda: basic.Lexer("<bench>", text).make_tokens()[0])
+    token_list, list_peak = peak_memory(lambda: list(buffer))  # The Tokens the lexer used to make, each with two Positions, sharing the values of the buffer
+    print(f"Lexing {len(text) / (1024 * 1024):.2f} MB into {len(buffer)} tokens")
+    for label, tokens, peak in (("list of Tokens", token_list, list_peak), ("TokenBuffer", buffer, buffer_peak)):
+        parse = best_time(lambda: basic.Parser(tokens).parse(), args.repeat)
+        print(f"  {label:<15} {peak / len(buffer):6.1f} bytes per token, parsed in {parse:.3f}s")
+    lex = best_time(lambda: basic.Lexer("<bench>", text).make_tokens(), args.repeat)
+    print(f"  make_tokens took {lex:.3f}s")
+
+
+def bench_stream(args):  # Compares the memory used to lex a program from a string with lexing it from a stream
+    text = generate_expression(args.megabytes)
+    data = text.encode()
+    size = len(text) / (1024 * 1024)
+    count_tokens = lambda tokens: sum(1 for _ in tokens)
+
+    listed = best_time(lambda: basic.Lexer("<bench>", data.decode()).make_tokens(), args.repeat)
+    streamed = best_time(lambda: count_tokens(basic.StreamLexer("<bench>", io.BytesIO(data)).make_tokens()), args.repeat)
+    (tokens, error), listed_peak = peak_memory(lambda: basic.Lexer("<bench>", data.decode()).make_tokens())
+    count, streamed_peak = peak_memory(lambda: count_tokens(basic.StreamLexer("<bench>", io.BytesIO(data)).make_tokens()))
+    print(f"Lexing {size:.2f} MB of bytes into {count} tokens")
+    print(f"  Lexer.make_tokens:       {listed:.3f}s, peak {listed_peak / (1024 * 1024):8.1f} MB")
+    print(f"  StreamLexer.make_tokens: {streamed:.3f}s, peak {streamed_peak / (1024 * 1024):8.1f} MB")
+
+
+def generate_broken_lines(lines, every=10):  # A script of many lines, every tenth of them broken with an illegal character or a syntax error
+    return "\n".join(f"VAR v{i} = {i} $ 2" if i % (2 * every) == 0 else f"VAR v{i} = ({i} * 2" if i % every == 0 else f"VAR v{i} = {i} * 2 + ({i} - 1)"
+                     for i in range(lines))
+
+
+def bench_diagnostics(args):  # Finds every error of a broken script one run at a time, fixing each error found, against check_program in one pass
+    lines = max(100, int(args.megabytes * 5000))
+
+    def one_at_a_time(text):  # What a linter had to do before: compile, report the first error, blank its line and compile again
+        script, messages = text.split("\n"), []
+        while True:
+            error = basic.compile_program("<bench>", "\n".join(script)).error
+            if error is None: return messages
+            messages.append(error.message())
+            script[error.pos_start.line_num] = ""
+
+    small = generate_broken_lines(1000)
+    print(f"Finding the {len(basic.check_program('<bench>', small))} errors of 1000 lines")
+    print(f"  one per compile: {best_time(lambda: one_at_a_time(small), args.repeat):.3f}s")
+    print(f"  check_program:   {best_time(lambda: basic.format_errors(basic.check_program('<bench>', small)), args.repeat):.3f}s")
+    for scale in (1, 2, 4):  # Checking and rendering stay linear in the size of the script however many errors it has
+        text = generate_broken_lines(lines * scale)
+        errors = basic.check_program("<bench>", text)
+        checked = best_time(lambda: basic.check_program("<bench>", text), args.repeat)
+        rendered = best_time(lambda: basic.format_errors(errors), args.repeat)
+        print(f"  {lines * scale} lines, {len(errors)} errors: checked in {checked:.3f}s, rendered in {rendered:.3f}s")
+
+
+# Benchmark suite
+def measure(func, iterations):  # Times each call of func, returning ops/sec, the p50 and p99 latencies and the peak memory of one call
+    func()  # Warm up
+    latencies = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()  # Peak memory is measured on a separate call as tracemalloc slows everything down
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "ops_per_sec": iterations / sum(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_suite(scale, iterations, engine):
+    """
+    Times each phase on its own for every workload: Lexer.make_tokens, Parser.parse, Interpreter.execute (the tree walker) and a full run
+    through a session with caching turned off, which lexes, parses and runs the program with the chosen engine.
+    """
+    results = {}
+    for name, generate in WORKLOADS.items():
+        text, variables = generate(scale)
+        session = basic.Session(engine=engine, cache_size=0)
+        for var_name, value in variables.items():
+            session.set(var_name, value)
+
+        tokens, error = basic.Lexer("<bench>", text).make_tokens()
+        node = basic.Parser(tokens).parse().node
+        phases = {
+            "lexer": lambda: basic.Lexer("<bench>", text).make_tokens(),
+            "parser": lambda: basic.Parser(tokens).parse(),
+            "interpreter": lambda: basic.Interpreter().execute(node, session.context),
+            "run": lambda: session.run("<bench>", text),
+        }
+        for phase, func in phases.items():
+            results[f"{name}/{phase}"] = measure(func, iterations)
+            print_result(f"{name}/{phase}", results[f"{name}/{phase}"])
+
+    return {
+        "metadata": {"engine": engine, "scale": scale, "iterations": iterations, "python": platform.python_version()},
+        "results": results,
+    }
+
+
+def print_result(key, result):
+    print(f"  {key:<30} {result['ops_per_sec']:12.1f} ops/s  p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  peak {result['peak_kb']:10.1f} KB")
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Returns the benchmarks whose speed fell by more than the threshold (a fraction). The speed is compared on the median latency,
+    which is steadier than the mean on a busy machine.
+    """
+    regressions = []
+    print(f"Compared with the baseline ({baseline['metadata']['engine']} engine), a regression is a drop of more than {threshold:.0%} in speed")
+    for key, result in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            print(f"  {key:<30} not in the baseline")
+            continue
+        change = old["p50_ms"] / result["p50_ms"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"  {key:<30} p50 {old['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms ({change:+7.1%} speed){flag}")
+    return regressions
+
+
+def bench_suite(args):
+    print(f"Running the suite with the {args.engine} engine")
+    results = run_suite(args.scale, args.iterations, args.engine)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved the results to {args.save}")
+
+
+def bench_compare(args):  # Runs the suite and compares it with a saved baseline, exiting with status 1 if anything regressed
+    if not args.baseline:
+        sys.exit("compare needs --baseline")
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    metadata = baseline["metadata"]
+    print(f"Running the suite with the {args.engine} engine")
+    results = run_suite(metadata["scale"], metadata["iterations"], args.engine)  # Same workloads as the baseline
+    regressions = compare_results(baseline, results, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+BENCHMARKS = {
+    "lexer": bench_lexer,
+    "memory": bench_memory,
+    "profiler": bench_profiler,
+    "engines": bench_engines,
+    "jit": bench_jit,
+    "sharing": bench_sharing,
+    "reactive": bench_reactive,
+    "variables": bench_variables,
+    "nesting": bench_nesting,
+    "tokens": bench_tokens,
+    "stream": bench_stream,
+    "diagnostics": bench_diagnostics,
+    "statements": bench_statements,
+    "startup": bench_startup,
+    "numbers": bench_numbers,
+    "limits": bench_limits,
+    "server": bench_server,
+    "suite": bench_suite,
+    "compare": bench_compare,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the BASIC interpreter")
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("--megabytes", type=float, default=2, help="Size of the generated source")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported")
+    parser.add_argument("--scale", type=int, default=1, help="Size multiplier for the suite's workloads")
+    parser.add_argument("--iterations", type=int, default=200, help="Number of timed calls per benchmark in the suite")
+    parser.add_argument("--engine", choices=basic.ENGINES, default="tree", help="Engine used by the suite's full runs")
+    parser.add_argument("--save", help="File to save the suite's results to as a JSON baseline")
+    parser.add_argument("--baseline", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Fractional drop in speed, measured on the median (p50) latency, which counts as a regression")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,118 @@
+# Runs many independent BASIC programs in parallel, e.g. python runner.py scripts/ --workers 4
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+import argparse
+import os
+import sys
+import time
+
+import basic
+
+
+# File result class
+class FileResult:  # The outcome of running one file, kept as plain strings so it is cheap to send back from a worker process
+    def __init__(self, path, value=None, error=None):
+        self.path = path
+        self.value = value  # The printed result of the program
+        self.error = error  # The error message, if the program failed
+
+    def __repr__(self):
+        return f"{self.path}: {self.error if self.error else self.value}"
+
+
+def collect_files(paths, pattern=".bas"):  # Expands directories into their files ending with the pattern, in a stable order
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(pattern))
+        else:
+            files.append(path)
+    return files
+
+
+def run_file(path, engine="tree", optimize=False, cache_dir=None, numbers="python", limits=None, check=False):  # Runs one file in a fresh session, so no file can see another file's variables
+    try:
+        with open(path) as file:
+            text = file.read()
+    except OSError as error:
+        return FileResult(path, error=f"Could not read file: {error}")
+
+    if check:  # Only lexes and parses the file, reporting every error in it instead of the first one
+        errors = basic.check_program(path, text)
+        if errors: return FileResult(path, error=basic.format_errors(errors))
+        return FileResult(path, value="no errors")
+
+    disk_cache = basic.DiskCache(cache_dir) if cache_dir else None
+    value, error = basic.Session(engine=engine, optimize=optimize, cache_size=0, disk_cache=disk_cache, numbers=numbers, limits=limits).run(path, text)
+    if error: return FileResult(path, error=error.message())
+    return FileResult(path, value=repr(value))
+
+
+def run_chunk(paths, engine="tree", optimize=False, cache_dir=None, numbers="python", limits=None, check=False):
+    return [run_file(path, engine, optimize, cache_dir, numbers, limits, check) for path in paths]
+
+
+def run_files(paths, workers=None, chunk_size=16, ordered=True, engine="tree", optimize=False, cache_dir=None, numbers="python", limits=None, check=False):
+    """
+    Runs the files and yields a FileResult for each of them. With ordered=True the results come back in the order of paths,
+    otherwise each chunk is yielded as soon as it completes. workers=1 runs everything in this process, which gives the same
+    results as the worker processes since every file gets its own symbol table either way. With a cache_dir the parsed programs
+    are kept in a basic.DiskCache there, so later runs skip lexing and parsing the files which haven't changed. numbers is the name of
+    the numeric backend to run with, the size limits of the backends stop one costly expression from holding up a worker. limits are
+    the basic.Limits each file is run under, e.g. a timeout per file. With check=True the files are only checked for errors instead of run,
+    and the error of a file holds every illegal character and syntax error in it (see basic.check_program).
+    """
+    run_one = partial(run_chunk, engine=engine, optimize=optimize, cache_dir=cache_dir, numbers=numbers, limits=limits, check=check)
+    chunks = [paths[index:index + chunk_size] for index in range(0, len(paths), chunk_size)]
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from run_one(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            for results in executor.map(run_one, chunks):
+                yield from results
+        else:
+            futures = [executor.submit(run_one, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                yield from future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs BASIC programs in parallel")
+    parser.add_argument("paths", nargs="+", help="Files or directories of programs to run")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Number of files sent to a worker at a time")
+    parser.add_argument("--unordered", action="store_true", help="Print results as they complete instead of in file order")
+    parser.add_argument("--pattern", default=".bas", help="File ending to look for inside directories")
+    parser.add_argument("--engine", choices=basic.ENGINES, default="tree")
+    parser.add_argument("--optimize", action="store_true")
+    parser.add_argument("--cache-dir", help="Directory to keep the parsed programs in between runs")
+    parser.add_argument("--numbers", choices=basic.NUMBER_BACKENDS, default="python", help="Numeric backend to run with")
+    parser.add_argument("--max-steps", type=int, help="Most nodes (or instructions) one program may run")
+    parser.add_argument("--timeout", type=float, help="Most seconds one program may run for")
+    parser.add_argument("--max-bits", type=int, help="Most bits in any integer")
+    parser.add_argument("--max-tokens", type=int, help="Most tokens in one program")
+    parser.add_argument("--check", action="store_true", help="Report every syntax error in the files instead of running them")
+    args = parser.parse_args()
+
+    limits = None
+    if any(limit is not None for limit in (args.max_steps, args.timeout, args.max_bits, args.max_tokens)):
+        limits = basic.Limits(args.max_steps, args.timeout, args.max_bits, max_tokens=args.max_tokens)
+    files = collect_files(args.paths, args.pattern)
+    start = time.perf_counter()
+    failed = 0
+    for result in run_files(files, args.workers, args.chunk_size, not args.unordered, args.engine, args.optimize, args.cache_dir, args.numbers, limits, args.check):
+        if result.error:
+            failed += 1
+            print(f"{result.path}:\n{result.error}")
+        else:
+            print(f"{result.path}: {result.value}")
+    elapsed = time.perf_counter() - start
+
+    rate = len(files) / elapsed if elapsed > 0 else 0
+    print(f"Ran {len(files)} programs ({failed} failed) in {elapsed:.2f}s, {rate:.1f} programs/s", file=sys.stderr)
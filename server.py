@@ -0,0 +1,275 @@
+# Serves BASIC programs to many clients over line delimited JSON, e.g. python server.py --port 8765 or python server.py --unix /tmp/basic.sock
+# Each request is one line such as {"id": 1, "text": "VAR a = 2 : a * 3"} (with an optional "engine") and gets back one line such as
+# {"id": 1, "value": "6", "error": null}. Responses come back as they complete, so a client matches them up by id.
+# {"op": "metrics"} gets back the latency and throughput of the server instead.
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import suppress
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import basic
+
+
+worker_sessions = {}  # The session of each set of settings in a worker process, kept so its program cache lasts between batches
+
+
+def run_batch(requests, settings):
+    """
+    Runs a batch of (text, engine) requests in a worker and returns the value and error message of each as plain strings, which are cheap
+    to send back from a worker process. Every request runs in a fork of the worker's session, so one request can never see the variables
+    another one set and two requests with the same text always get the same result.
+    """
+    session = worker_sessions.get(settings)
+    if session is None:
+        optimize, numbers, max_steps, timeout, max_bits, max_tokens = settings
+        limits = None
+        if any(limit is not None for limit in (max_steps, timeout, max_bits, max_tokens)):
+            limits = basic.Limits(max_steps, timeout, max_bits, max_tokens=max_tokens)
+        session = worker_sessions[settings] = basic.Session(optimize=optimize, numbers=numbers, limits=limits)
+
+    results = []
+    for text, engine in requests:
+        value, error = session.fork().run("<request>", text, engine)
+        results.append((None, error.message()) if error else (repr(value), None))
+    return results
+
+
+# Server class
+class Server:
+    """
+    Accepts requests from many connections and runs them in batches on a pool of worker processes, so the event loop is never blocked
+    by a long program. Requests wait in a queue until batch_size of them are there or batch_delay seconds have passed, and identical
+    requests which are waiting or running at the same time are run once and share the result. At most max_pending requests are waited
+    on at a time, past that the server stops reading from the connections, which pushes back on the clients through TCP flow control.
+    workers=0 runs the batches on one thread in this process instead, which is handy for testing and debugging.
+    """
+    def __init__(self, workers=None, batch_size=64, batch_delay=0.002, max_pending=1024, engine="tree", optimize=False, numbers="python",
+                 limits=None, max_line=1 << 20):
+        if engine not in basic.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(basic.ENGINES)}")
+        if numbers not in basic.NUMBER_BACKENDS:
+            raise ValueError(f"Unknown numeric backend '{numbers}', expected one of: {', '.join(basic.NUMBER_BACKENDS)}")
+        limits = limits or basic.Limits()
+        self.settings = (optimize, numbers, limits.max_steps, limits.timeout, limits.max_bits, limits.max_tokens)  # Sent with every batch, so it is kept hashable and small
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.engine = engine
+        self.max_line = max_line  # The longest request line accepted, in bytes
+        self.executor = None
+        self.servers = []
+
+        self.pending = {}  # Maps each (text, engine) which is waiting or running to the future of its result
+        self.queue = deque()  # The (text, engine) requests waiting for a batch, in arrival order
+        self.queued = None  # Set when there is something in the queue
+        self.slots = None  # A semaphore of max_pending, made in start() so it belongs to the running event loop
+        self.batches = None  # A semaphore which limits the batches running at a time to a couple per worker, so the rest wait and batch up
+        self.batcher = None
+
+        # Counters for metrics()
+        self.started = time.perf_counter()
+        self.connections = 0
+        self.requests = 0
+        self.responses = 0
+        self.failures = 0  # Requests which were answered with an error
+        self.bad_requests = 0
+        self.deduplicated = 0
+        self.batch_count = 0
+        self.batched = 0  # Requests sent to the workers, which is fewer than requests when some were deduplicated
+        self.latencies = deque(maxlen=10000)  # Seconds from reading each of the most recent requests to answering it
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):  # Listens on the Unix socket at path if it is given, otherwise on the TCP host and port
+        if self.executor is not None:  # Already started, e.g. listening on a second address
+            return await self.listen(host, port, path)
+        self.started = time.perf_counter()
+        self.executor = ThreadPoolExecutor(1) if self.workers == 0 else ProcessPoolExecutor(self.workers)
+        self.queued = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_pending)
+        self.batches = asyncio.Semaphore(2 * max(self.workers, 1))
+        self.batcher = asyncio.create_task(self.run_batches())
+        return await self.listen(host, port, path)
+
+    async def listen(self, host, port, path):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path, limit=self.max_line)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=self.max_line)
+        self.servers.append(server)
+        return server
+
+    async def close(self):  # Stops accepting connections and shuts the workers down once the running batches are done
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        if self.batcher is not None:
+            self.batcher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.batcher
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def handle(self, reader, writer):  # Reads the requests of one connection, each one is answered by its own task
+        self.connections += 1
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # The line is longer than max_line, the rest of the stream can't be split into requests any more
+                    self.bad_requests += 1
+                    await self.reply(writer, {"id": None, "value": None, "error": f"Bad request: a line is longer than {self.max_line} bytes"})
+                    break
+                if not line: break
+                if not line.strip(): continue
+
+                request, problem = self.parse_request(line)
+                if problem:
+                    self.bad_requests += 1
+                    await self.reply(writer, {"id": request.get("id") if isinstance(request, dict) else None, "value": None, "error": f"Bad request: {problem}"})
+                    continue
+                if request.get("op") == "metrics":
+                    await self.reply(writer, {"id": request.get("id"), "metrics": self.metrics()})
+                    continue
+
+                await self.slots.acquire()  # Waits while max_pending requests are in flight, so nothing more is read from the connection
+                task = asyncio.create_task(self.answer(request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.connections -= 1
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def parse_request(self, line):  # Returns the request and a description of what is wrong with it, if anything
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return None, "not valid JSON"
+        if not isinstance(request, dict):
+            return request, "expected a JSON object"
+        if request.get("op") == "metrics":
+            return request, None
+        if not isinstance(request.get("text"), str):
+            return request, "expected a string 'text'"
+        engine = request.get("engine", self.engine)
+        if engine not in basic.ENGINES:
+            return request, f"unknown engine '{engine}', expected one of: {', '.join(basic.ENGINES)}"
+        return request, None
+
+    async def answer(self, request, writer):
+        start = time.perf_counter()
+        self.requests += 1
+        try:
+            value, error = await self.evaluate(request["text"], request.get("engine", self.engine))
+        finally:
+            self.slots.release()
+        self.latencies.append(time.perf_counter() - start)
+        self.responses += 1
+        if error: self.failures += 1
+        with suppress(ConnectionError):  # The client may have gone away before its answer was ready
+            await self.reply(writer, {"id": request.get("id"), "value": value, "error": error})
+
+    async def reply(self, writer, response):
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def evaluate(self, text, engine="tree"):  # Returns the value and error message of a program, sharing the run of an identical request in flight
+        key = (text, engine)
+        future = self.pending.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = self.pending[key] = asyncio.get_running_loop().create_future()
+            self.queue.append(key)
+            self.queued.set()
+        return await asyncio.shield(future)  # Shielded so one client going away doesn't cancel the result for the others
+
+    async def run_batches(self):  # Takes batches off the queue for as long as the server runs
+        while True:
+            await self.queued.wait()
+            if len(self.queue) < self.batch_size:
+                await asyncio.sleep(self.batch_delay)  # Gives the batch a moment to fill up
+            await self.batches.acquire()
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            if not self.queue:
+                self.queued.clear()
+            asyncio.create_task(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        self.batch_count += 1
+        self.batched += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, run_batch, batch, self.settings)
+        except Exception as exception:  # E.g. a worker process died, every request of the batch gets the error
+            results = [(None, f"Internal error: {exception!r}")] * len(batch)
+        finally:
+            self.batches.release()
+        for key, result in zip(batch, results):
+            self.pending.pop(key).set_result(result)
+
+    def metrics(self):  # The counters and the latency and throughput of the server, as a JSON friendly dictionary
+        uptime = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        percentile = lambda fraction: latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000 if latencies else None
+        return {
+            "uptime_s": uptime,
+            "connections": self.connections,
+            "requests": self.requests,
+            "responses": self.responses,
+            "failures": self.failures,
+            "bad_requests": self.bad_requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batch_count,
+            "mean_batch_size": self.batched / self.batch_count if self.batch_count else None,
+            "in_flight": len(self.pending),
+            "queued": len(self.queue),
+            "responses_per_sec": self.responses / uptime if uptime > 0 else None,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": latencies[-1] * 1000 if latencies else None,
+        }
+
+
+async def serve(server, host, port, path):
+    listener = await server.start(host, port, path)
+    names = ", ".join(str(socket.getsockname()) for socket in listener.sockets)
+    print(f"Serving BASIC on {names}", file=sys.stderr)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves BASIC programs over line delimited JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Path of a Unix socket to listen on instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (defaults to the number of CPUs, 0 runs in a thread)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Most requests sent to a worker at a time")
+    parser.add_argument("--batch-delay", type=float, default=0.002, help="Seconds a batch waits to fill up")
+    parser.add_argument("--max-pending", type=int, default=1024, help="Most requests in flight before the server stops reading")
+    parser.add_argument("--engine", choices=basic.ENGINES, default="tree")
+    parser.add_argument("--optimize", action="store_true")
+    parser.add_argument("--numbers", choices=basic.NUMBER_BACKENDS, default="python", help="Numeric backend to run with")
+    parser.add_argument("--max-steps", type=int, help="Most nodes (or instructions) one request may run")
+    parser.add_argument("--timeout", type=float, help="Most seconds one request may run for")
+    parser.add_argument("--max-bits", type=int, help="Most bits in any integer")
+    parser.add_argument("--max-tokens", type=int, help="Most tokens in one request")
+    args = parser.parse_args()
+
+    limits = basic.Limits(args.max_steps, args.timeout, args.max_bits, max_tokens=args.max_tokens)
+    server = Server(args.workers, args.batch_size, args.batch_delay, args.max_pending, args.engine, args.optimize, args.numbers, limits)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(serve(server, args.host, args.port, args.unix))
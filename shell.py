@@ -1,9 +1,16 @@
+import sys
+
 import basic
 
+profile = "--profile" in sys.argv  # With --profile a summary of where the time went is printed after each result
+reactive = "--reactive" in sys.argv  # With --reactive assigning a variable recomputes the variables which were assigned from it
+session = basic.Session(reactive=True) if reactive else basic.default_session
+
 while True:  # Infinite loop to read the raw input from the terminal window
     text = input("basic > ")
-    result, error = basic.run("<stdin>", text)  # Uses the run function in the basic file to return the token objects and any errors
+    profiler = basic.Profiler() if profile else None
+    result, error = session.run("<stdin>", text, profiler=profiler)  # The default session is the one basic.run uses
 
     if error: print(error.message())
     else: print(result)
-    
\ No newline at end of file
+    if profiler: print(profiler.summary())
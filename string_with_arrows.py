@@ -1,26 +1,41 @@
-def string_with_arrows(text, pos_start, pos_end):
-    result = ""
+def line_start_index(text):  # The index of the first character of each line of the text
+    line_starts = [0]
+    newline = text.find('\n')
+    while newline >= 0:
+        line_starts.append(newline + 1)
+        newline = text.find('\n', newline + 1)
+    return line_starts
 
-    # Calculate the indices
-    index_start = max(text.rfind('\n', 0, pos_start.index), 0)
-    index_end = text.find('\n', index_start + 1)
-    if index_end < 0: index_end = len(text)
+
+def string_with_arrows(text, pos_start, pos_end, line_starts=None, width=None):
+    """
+    The lines of the text from pos_start to pos_end, each followed by a line of arrows under the span. The lines are found in line_starts,
+    the index of the first character of each line, so pass the index of the text (e.g. Source.line_starts) when rendering many errors of
+    one text; without it the index is built for this call. Lines longer than width are cut down to width characters around the arrows.
+    """
+    if line_starts is None:
+        line_starts = line_start_index(text)
+    first_line, last_line = pos_start.line_num, pos_end.line_num
+    parts = []
 
     # Generate each line
-    line_count = pos_end.line_num - pos_start.line_num + 1
-    for i in range(line_count):
-        # Calculate line columns
+    for line_num in range(first_line, last_line + 1):
+        # Like before the index was kept, every line but the first of the text is shown with the new line in front of it
+        prefix = '\n' if line_num > 0 else ''
+        index_start = line_starts[line_num]
+        index_end = line_starts[line_num + 1] - 1 if line_num + 1 < len(line_starts) else len(text)
         line = text[index_start:index_end]
-        col_start = pos_start.col_num if i == 0 else 0
-        col_end = pos_end.col_num if i == line_count - 1 else len(line) - 1
-        
-        # Append to result
-        result += line + '\n'
-        result += ' ' * col_start + '^' * (col_end - col_start)
 
-        # Recalculate indices
-        index_start = index_end
-        index_end = text.find('\n', index_start + 1)
-        if index_end < 0: index_end = len(text)
+        # Calculate line columns
+        col_start = pos_start.col_num if line_num == first_line else 0
+        col_end = pos_end.col_num if line_num == last_line else len(prefix) + len(line) - 1
+
+        if width is not None and len(line) > width:  # Only the part of a long line around the arrows, e.g. of a generated program on one line
+            cut = max(0, min(col_start - width // 2, len(line) - width))
+            line = line[cut:cut + width]
+            col_start, col_end = col_start - cut, min(col_end - cut, width)
+
+        # Append to result
+        parts.append(prefix + line.replace('\t', '') + '\n' + ' ' * col_start + '^' * (col_end - col_start))
 
-    return result.replace('\t', '')
\ No newline at end of file
+    return ''.join(parts)